@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from teplitsa_parser import (
+    HTTP_HEADERS,
+    setup_logging,
+    is_html_page_available,
+    has_required_elements,
+    extract_teplitsa_data_from_html,
+    extract_teplitsa_data,
+)
+from run_metrics import PageTimer
+
+# Итог обработки одной ссылки
+RESULT_OK = "ok"
+RESULT_404 = "404"
+RESULT_BROWSER = "browser"  # HTML без нужных элементов / ошибка — доберём через Chrome
+
+##############################
+# 1. РАЗБОР ОТВЕТА (В ПОТОКЕ) #
+##############################
+def parse_response(status, html, url, logger, cache=None, headers=None, memo=None):
+    """
+    Синхронный разбор ответа — запускается через asyncio.to_thread,
+    чтобы BeautifulSoup не блокировал event loop.
+    cache/headers — PageCache и заголовки ответа: тело сохраняется в кэш,
+    а если оно не изменилось, разбор пропускается. headers=None — тело уже
+    взято из кэша (ответ 304), сохранять нечего.
+    memo — CharacteristicsMemo: характеристики товара один раз на все города.
+    Возвращает (RESULT_*, data).
+    """
+    if cache is not None and headers is not None and status == 200 and html:
+        changed = cache.store(url, html, headers.get("ETag"), headers.get("Last-Modified"))
+        parsed = None if changed else cache.cached_parsed(url)
+        if parsed is not None:
+            logger.info("Страница не изменилась, разбор пропущен (запись из кэша).")
+            return RESULT_OK, parsed
+
+    if status == 404:
+        logger.warning(f"Страница {url} не найдена (404).")
+        return RESULT_404, None
+    if status != 200 or not html:
+        return RESULT_BROWSER, None
+
+    soup = BeautifulSoup(html, "html.parser")
+    if not is_html_page_available(soup, logger):
+        logger.warning(f"Страница {url} не найдена (404).")
+        return RESULT_404, None
+    if not has_required_elements(soup):
+        logger.info("В HTML нет нужных элементов, переходим на браузер.")
+        return RESULT_BROWSER, None
+    data = extract_teplitsa_data_from_html(soup, logger, url, memo)
+    if cache is not None:
+        cache.save_parsed(url, data)
+    return RESULT_OK, data
+
+##############################
+# 2. ЗАГРУЗКА ОДНОЙ ССЫЛКИ    #
+##############################
+async def fetch_one(http, link_info, timeout, cache=None, timer=None, limiter=None, memo=None):
+    """
+    timer — PageTimer: http_fetch (с ожиданием свободного соединения в пуле)
+    и html_parse для сводки прогона.
+    limiter — HostRateLimiter: ждём токен поддомена, ответ подстраивает скорость.
+    """
+    timer = timer or PageTimer()
+    url = link_info["URL"]
+    logger = setup_logging(link_info["Город"])
+    logger.info(f"\nЗагружаем (async): {url}")
+    request_headers = cache.conditional_headers(url) if cache is not None else {}
+    if limiter is not None:
+        await limiter.wait_async(url)
+    started = time.monotonic()
+    try:
+        with timer.stage("http_fetch"):
+            async with http.get(
+                url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                status = resp.status
+                headers = dict(resp.headers)
+                html = await resp.text()
+        logger.info(f"HTTP {status} для {url}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Ошибка HTTP-запроса {url}: {e}")
+        if limiter is not None:
+            limiter.observe(url, time.monotonic() - started, error=True)
+        return RESULT_BROWSER, None
+    if limiter is not None:
+        limiter.observe(url, time.monotonic() - started, status, retry_after=headers.get("Retry-After"))
+
+    if status == 304:
+        html = cache.read_body(url)
+        if html is None:
+            return RESULT_BROWSER, None
+        cache.mark_fresh(url)
+        parsed = cache.cached_parsed(url)
+        if parsed is not None:
+            logger.info("Страница не изменилась (304), разбор пропущен (запись из кэша).")
+            return RESULT_OK, parsed
+        status, headers = 200, None
+
+    with timer.stage("html_parse"):
+        return await asyncio.to_thread(parse_response, status, html, url, logger, cache, headers, memo)
+
+def finish_link(link_info, tepl_data, on_result=None):
+    """Дописывает Город, логирует итог и передаёт его в on_result (журнал прогресса)."""
+    city_name = link_info["Город"]
+    logger_city = setup_logging(city_name)
+    if tepl_data:
+        tepl_data["Город"] = city_name
+        logger_city.info(f"Данные для {link_info['Название']} ({city_name}) извлечены.")
+    else:
+        logger_city.warning(f"Не удалось извлечь данные для {link_info['Название']} ({city_name}).")
+    if on_result is not None:
+        on_result(link_info, tepl_data)
+    return tepl_data
+
+async def crawl(links, max_concurrency=32, per_host=4, timeout=15, cache=None, on_result=None, metrics=None,
+                limiter=None, memo=None):
+    """
+    Параллельно загружает все ссылки.
+    max_concurrency — общий лимит одновременных запросов,
+    per_host — лимит на один поддомен (spb.teplitsa-rus.ru, belgorod... — разные хосты),
+    limiter — ещё и лимит скорости на поддомен (HostRateLimiter).
+    Готовые (не требующие браузера) результаты сразу уходят в on_result.
+    Результаты (result, data, timer) возвращаются в том же порядке, что и links;
+    замер страниц, которым нужен браузер, продолжается в run_async_crawl.
+    """
+    async def fetch_and_finish(http, link_info):
+        timer = PageTimer()
+        result, tepl_data = await fetch_one(http, link_info, timeout, cache, timer, limiter, memo)
+        if result != RESULT_BROWSER:
+            # Итог — в метрики до on_result: по нему очередь повторов решает, откладывать ли ссылку
+            if metrics is not None:
+                status = "404" if result == RESULT_404 else "ok"
+                metrics.observe(link_info["URL"], link_info["Город"], timer, status=status)
+            tepl_data = finish_link(link_info, tepl_data, on_result)
+        return result, tepl_data, timer
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=per_host)
+    async with aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS) as http:
+        tasks = [fetch_and_finish(http, link_info) for link_info in links]
+        return await asyncio.gather(*tasks)
+
+##############################
+# 3. ЗАПУСК ИЗ main           #
+##############################
+def run_async_crawl(links, get_driver=None, max_concurrency=32, per_host=4, timeout=15, cache=None,
+                    on_result=None, metrics=None, city=None, limiter=None, memo=None):
+    """
+    Асинхронный проход по всем ссылкам + последовательный добор через Chrome
+    для страниц, которым нужен браузер. Возвращает all_data в том же виде
+    и порядке, что и обычный цикл в teplitsa_parser.main.
+    on_result(link_info, data) вызывается по мере готовности каждой ссылки.
+    metrics — RunMetrics для сводки прогона, city — CityPreset для добора через Chrome,
+    limiter — HostRateLimiter для запросов и добора через Chrome,
+    memo — CharacteristicsMemo: характеристики товара один раз на все города.
+    """
+    logging.info(
+        f"Async-режим: {len(links)} ссылок, всего до {max_concurrency} запросов, "
+        f"до {per_host} на поддомен."
+    )
+    results = asyncio.run(
+        crawl(links, max_concurrency, per_host, timeout, cache, on_result, metrics, limiter, memo)
+    )
+
+    all_data = []
+    for link_info, (result, tepl_data, timer) in zip(links, results):
+        if result == RESULT_BROWSER:
+            if get_driver is not None:
+                logger_city = setup_logging(link_info["Город"])
+                tepl_data = extract_teplitsa_data(get_driver(), link_info["URL"], logger_city,
+                                                  metrics=metrics, timer=timer, city=city, limiter=limiter,
+                                                  memo=memo)
+            elif metrics is not None:
+                metrics.observe(link_info["URL"], link_info["Город"], timer, status="failed")
+            tepl_data = finish_link(link_info, tepl_data, on_result)
+        if tepl_data:
+            all_data.append(tepl_data)
+
+    return all_data
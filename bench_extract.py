@@ -0,0 +1,318 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from teplitsa_parser import (
+    HTML_PARSER,
+    cell_text,
+    is_page_available,
+    is_html_page_available,
+    extract_characteristics,
+    extract_prices,
+    extract_prices_snapshot,
+    extract_teplitsa_data_from_html,
+)
+from catalog_listing import parse_catalog_cards
+
+FIXTURES = sorted(glob.glob(os.path.join("fixtures", "*.html"))) + ["index.html"]
+# Что должно извлекаться из каждой фикстуры: (записей, цен). Для товарных страниц
+# запись — html_page, цены — её «Цены» (у белгородской вёрстки без data-label —
+# позиционный разбор parse_teplitsa_belgorod), для каталога — карточки и их «Цена от».
+# Фикстура, из которой вдруг ничего не извлеклось, валит прогон, а не меряет пустой путь.
+EXPECTED = {
+    "product_404.html": (0, 0),
+    "product_accessory.html": (1, 0),
+    "product_belgorod.html": (1, 22),
+    "product_description_split.html": (1, 20),
+    "product_prod_desc.html": (1, 20),
+    "index.html": (55, 55),
+}
+BELGOROD_FIXTURE = "product_belgorod.html"
+
+##############################################
+# 1. ОФЛАЙН-ДРАЙВЕР ПОВЕРХ СОХРАНЁННОГО HTML #
+##############################################
+class OfflineElement:
+    def __init__(self, driver, tag):
+        self.driver = driver
+        self.tag = tag
+
+    @property
+    def text(self):
+        self.driver.calls += 1
+        text = cell_text(self.tag)
+        # Selenium отдаёт текст с учётом text-transform
+        if "uppercase" in (self.tag.get("style") or ""):
+            text = text.upper()
+        return text
+
+    def get_attribute(self, name):
+        self.driver.calls += 1
+        if name == "innerHTML":
+            return self.tag.decode_contents()
+        if name == "outerHTML":
+            return str(self.tag)
+        return self.tag.get(name)
+
+    def find_element(self, by, value):
+        return self.driver.find_in(self.tag, by, value, single=True)
+
+    def find_elements(self, by, value):
+        return self.driver.find_in(self.tag, by, value, single=False)
+
+class OfflineDriver:
+    """
+    Минимальная замена webdriver.Chrome для функций extract_*:
+    find_element(s) по CSS / тегу / двум XPath из teplitsa_parser, .text,
+    get_attribute, title. Каждое обращение считается в calls — столько
+    HTTP round trip'ов к chromedriver сделал бы настоящий драйвер.
+    """
+
+    XPATHS = {
+        "//h1": lambda soup: soup.find_all("h1"),
+        "//h1[contains(text(), '404')]": lambda soup: [
+            h1 for h1 in soup.find_all("h1") if "404" in "".join(h1.find_all(string=True, recursive=False))
+        ],
+    }
+
+    def __init__(self, html):
+        self.soup = BeautifulSoup(html, HTML_PARSER)
+        self.calls = 0
+
+    @property
+    def title(self):
+        self.calls += 1
+        return self.soup.title.get_text() if self.soup.title else ""
+
+    def find_in(self, root, by, value, single):
+        self.calls += 1
+        if by == By.CSS_SELECTOR:
+            tags = root.select(value)
+        elif by == By.TAG_NAME:
+            tags = root.find_all(value)
+        elif by == By.XPATH:
+            tags = self.XPATHS[value](root)
+        else:
+            raise ValueError(f"Неподдерживаемый локатор: {by}")
+        if single:
+            if not tags:
+                raise NoSuchElementException(f"{by}={value}")
+            return OfflineElement(self, tags[0])
+        return [OfflineElement(self, tag) for tag in tags]
+
+    def find_element(self, by, value):
+        return self.find_in(self.soup, by, value, single=True)
+
+    def find_elements(self, by, value):
+        return self.find_in(self.soup, by, value, single=False)
+
+########################################
+# 2. ИЗМЕРЯЕМЫЕ ФУНКЦИИ                #
+########################################
+def title_and_404(driver, logger):
+    """Проверка 404 и название (h1) — как в extract_teplitsa_data."""
+    if not is_page_available(driver, logger):
+        return None
+    try:
+        return driver.find_element(By.XPATH, "//h1").text.strip()
+    except NoSuchElementException:
+        return "Не указано"
+
+def html_page(html, logger):
+    """HTTP-путь целиком: разбор HTML + 404 + название/характеристики/цены."""
+    soup = BeautifulSoup(html, "html.parser")
+    if not is_html_page_available(soup, logger):
+        return None
+    return extract_teplitsa_data_from_html(soup, logger)
+
+def extraction_counts(fixture, html, logger, belgorod):
+    """(записей, цен), извлечённых из фикстуры, — для сверки с EXPECTED."""
+    if os.path.basename(fixture) == "index.html":
+        cards = parse_catalog_cards(html)
+        return len(cards), sum(1 for found in cards.values() if found[0]["Цена от"])
+    record = html_page(html, logger)
+    if record is None:
+        return 0, 0
+    if os.path.basename(fixture) == BELGOROD_FIXTURE:
+        return 1, len(belgorod.extract_prices(OfflineDriver(html)))
+    return 1, len(record["Цены"])
+
+def check_fixtures(pages, logger, belgorod):
+    """Сверяет извлечённое с EXPECTED; расхождение — выход с кодом 1 до замеров."""
+    problems = []
+    for fixture, html in pages.items():
+        name = os.path.basename(fixture)
+        got = extraction_counts(fixture, html, logger, belgorod)
+        if name not in EXPECTED:
+            problems.append(f"{name}: нет ожидаемых значений в EXPECTED (извлечено {got})")
+        elif got != EXPECTED[name]:
+            problems.append(f"{name}: извлечено (записей, цен) {got}, ожидалось {EXPECTED[name]}")
+    if problems:
+        raise SystemExit("Фикстуры извлекаются не так, как ожидалось:\n  " + "\n  ".join(problems))
+
+# Функции браузерного пути: (имя в отчёте, функция(driver, logger))
+DRIVER_FUNCS = [
+    ("title_404", title_and_404),
+    ("extract_characteristics", extract_characteristics),
+    ("extract_prices", extract_prices),
+    ("extract_prices_snapshot", extract_prices_snapshot),
+]
+
+def percentile(sorted_values, q):
+    idx = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+    }
+
+def measure(func, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def peak_kb(func):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+########################################
+# 3. ПРОГОН                            #
+########################################
+def run_bench(iterations):
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.DEBUG)  # все logger.* вызовы, как в боевом прогоне, но без записи
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+
+    # parse_teplitsa_belgorod при импорте настраивает логирование в файл; с уже
+    # заданным обработчиком basicConfig ничего не делает, и его лог никуда не пишется
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(logging.NullHandler())
+    import parse_teplitsa_belgorod as belgorod
+
+    pages = {path: open(path, encoding="utf-8").read() for path in FIXTURES}
+    check_fixtures(pages, logger, belgorod)
+    results = {"functions": {}, "pipelines": {}}
+
+    def record(name, fixture, func, calls=None):
+        stats = summarize(measure(func, iterations))
+        stats["peak_kb"] = peak_kb(func)
+        if calls is not None:
+            stats["webdriver_calls"] = calls
+        results["functions"].setdefault(name, {})[os.path.basename(fixture)] = stats
+
+    for fixture, html in pages.items():
+        driver = OfflineDriver(html)
+        for name, func in DRIVER_FUNCS:
+            driver.calls = 0
+            func(driver, logger)
+            calls = driver.calls
+            record(name, fixture, lambda: func(driver, logger), calls)
+        record("html_page", fixture, lambda: html_page(html, logger))
+        if os.path.basename(fixture) == BELGOROD_FIXTURE:
+            # Белгородская вёрстка: позиционный разбор таблиц (без data-label)
+            for name, func in [("belgorod_extract_prices", belgorod.extract_prices),
+                               ("belgorod_extract_characteristics", belgorod.extract_characteristics)]:
+                driver.calls = 0
+                func(driver)
+                record(name, fixture, lambda: func(driver), driver.calls)
+        if fixture == "index.html":
+            record("catalog_cards", fixture, lambda: parse_catalog_cards(html))
+
+    # Страниц в секунду на товарных страницах: браузерный путь (без навигации) и HTTP-путь
+    product_pages = [html for path, html in pages.items() if path != "index.html"]
+    drivers = [OfflineDriver(html) for html in product_pages]
+
+    def browser_pipeline():
+        for driver in drivers:
+            if title_and_404(driver, logger) is not None:
+                extract_characteristics(driver, logger)
+                extract_prices_snapshot(driver, logger)
+
+    def http_pipeline():
+        for html in product_pages:
+            html_page(html, logger)
+
+    for name, pipeline in [("browser_extract", browser_pipeline), ("http_page", http_pipeline)]:
+        latencies = measure(pipeline, iterations)
+        total = sum(latencies)
+        results["pipelines"][name] = {
+            "pages_per_sec": round(len(product_pages) * iterations / total, 1),
+            "peak_kb": peak_kb(pipeline),
+        }
+    return results
+
+def compare(old, new):
+    """Печатает изменение p50 и pages/sec относительно прошлого прогона."""
+    print("\nСравнение с прошлым прогоном (p50, мс):")
+    for name, fixtures in new["functions"].items():
+        for fixture, stats in fixtures.items():
+            before = old.get("functions", {}).get(name, {}).get(fixture)
+            if not before:
+                continue
+            delta = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+            print(f"  {name:26} {fixture:32} {before['p50_ms']:>9.3f} -> {stats['p50_ms']:>9.3f} ({delta:+.1f}%)")
+    for name, stats in new["pipelines"].items():
+        before = old.get("pipelines", {}).get(name)
+        if before:
+            print(f"  {name:26} pages/sec {before['pages_per_sec']} -> {stats['pages_per_sec']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Офлайн-бенчмарк функций извлечения teplitsa_parser.py на fixtures/*.html и index.html."
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--save", default="bench_results.json", help="куда сохранить результаты")
+    parser.add_argument("--compare", default=None, help="прошлый bench_results.json для сравнения")
+    args = parser.parse_args(argv)
+
+    results = run_bench(args.iterations)
+    results.update({
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "iterations": args.iterations,
+    })
+
+    for name, fixtures in results["functions"].items():
+        for fixture, stats in fixtures.items():
+            calls = f", вызовов WebDriver: {stats['webdriver_calls']}" if "webdriver_calls" in stats else ""
+            print(
+                f"{name:26} {fixture:32} p50 {stats['p50_ms']:.3f} мс, p90 {stats['p90_ms']:.3f}, "
+                f"p99 {stats['p99_ms']:.3f}, пик {stats['peak_kb']} КБ{calls}"
+            )
+    for name, stats in results["pipelines"].items():
+        print(f"{name:26} {stats['pages_per_sec']} стр/с, пик {stats['peak_kb']} КБ")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+    with open(args.save, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    print(f"\nРезультаты сохранены в '{args.save}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import logging
+import re
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup
+
+from teplitsa_parser import HTML_PARSER, fetch_html, cell_text, setup_logging
+
+PRICE_RE = re.compile(r"(\d[\d\s]*)\s*руб")
+
+#########################################
+# 1. РАЗБОР КАРТОЧЕК КАТАЛОГА             #
+#########################################
+def item_path(href):
+    """
+    Приводит ссылку на товар к виду из teplicy_links_final.csv:
+      item/2-teplica-arochnaya-25m.html        -> item/2-teplica-arochnaya-25m/
+      item/104-podvyazki-dlya-teplicy/index.html -> item/104-podvyazki-dlya-teplicy/
+      https://spb.teplitsa-rus.ru/item/2-.../   -> item/2-.../
+    Для ссылок не на товар возвращает None.
+    """
+    path = urlsplit(href).path.lstrip("/")
+    if not path.startswith("item/"):
+        return None
+    if path.endswith("/index.html"):
+        path = path[:-len("index.html")]
+    elif path.endswith(".html"):
+        path = path[:-len(".html")]
+    if not path.endswith("/"):
+        path += "/"
+    return path
+
+def price_text(tag):
+    """'Цена от 16990 руб.' / '16990 руб.' -> '16990 руб.' (или None)."""
+    if tag is None:
+        return None
+    match = PRICE_RE.search(cell_text(tag))
+    if not match:
+        return None
+    return f"{''.join(match.group(1).split())} руб."
+
+def parse_catalog_cards(html):
+    """
+    Карточки товаров со страницы каталога (структура как в index.html).
+    Два вида вёрстки:
+      - .wrapper-1 / .wrapper-2: .h3 a, .price ('Цена от ...'), .h-price ('Старая цена: ...');
+      - .P-left / .P-right (блок «хиты»): .name a, .popbuy-3 — цена, .popbuy-2 — старая цена.
+    Возвращает {item_path: [{"Название", "Цена от", "Старая цена"}, ...]}.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    cards = defaultdict(list)
+    for good in soup.select("div.good"):
+        link = good.select_one(".h3 a, .name a")
+        if link is None or not link.get("href"):
+            continue
+        path = item_path(link["href"])
+        if path is None:
+            continue
+        if good.select_one(".wrapper-2") is not None:
+            price = price_text(good.select_one(".price"))
+            old_price = price_text(good.select_one(".h-price"))
+        else:
+            price = price_text(good.select_one(".popbuy-3"))
+            old_price = price_text(good.select_one(".popbuy-2"))
+        cards[path].append({"Название": cell_text(link), "Цена от": price, "Старая цена": old_price})
+    return cards
+
+def unique_card(cards):
+    """Карточка, если все её вхождения на странице согласованы по цене, иначе None."""
+    prices = {card["Цена от"] for card in cards}
+    if len(prices) != 1 or None in prices:
+        return None
+    return cards[0]
+
+#########################################
+# 2. ОДНА СТРАНИЦА КАТАЛОГА НА ГОРОД       #
+#########################################
+def catalog_url(product_url):
+    """
+    Главная страница каталога того же города:
+      https://teplitsa-rus.ru/item/...?city=msk -> https://teplitsa-rus.ru/?city=msk
+      https://spb.teplitsa-rus.ru/item/.../     -> https://spb.teplitsa-rus.ru/
+    """
+    parts = urlsplit(product_url)
+    url = f"{parts.scheme}://{parts.netloc}/"
+    if parts.query:
+        url += f"?{parts.query}"
+    return url
+
+def run_catalog_crawl(links, session, fallback=None, on_result=None, limiter=None):
+    """
+    Быстрое обновление цен: по одной странице каталога на город вместо
+    страницы каждого товара. Для пары (теплица, город) берётся «Цена от»
+    из карточки; если карточки нет или цены в ней расходятся,
+    вызывается fallback(link_info) — полный разбор страницы товара.
+    Название — из карточки заглавными, как h1 в записях со страницы товара;
+    «Источник» — откуда запись («каталог» / «страница товара»). Цен по
+    поликарбонату и длине («Цены») у карточки нет, поэтому вывод этого
+    режима пишется в отдельный файл и в историю цен не попадает.
+    limiter — HostRateLimiter для запросов страниц каталога.
+    Возвращает all_data в порядке links.
+    """
+    by_catalog = defaultdict(list)
+    for idx, link_info in enumerate(links):
+        by_catalog[catalog_url(link_info["URL"])].append((idx, link_info))
+    logging.info(f"Каталог: {len(by_catalog)} страниц вместо {len(links)} страниц товаров.")
+
+    results = {}
+    from_catalog = 0
+    for url, city_links in by_catalog.items():
+        logger_city = setup_logging(city_links[0][1]["Город"])
+        status, html = fetch_html(session, url, logger_city, limiter=limiter)
+        cards = parse_catalog_cards(html) if status == 200 and html else {}
+        logger_city.info(f"Каталог {url}: карточек товаров {len(cards)}.")
+
+        for idx, link_info in city_links:
+            card = None
+            path = item_path(link_info["URL"])
+            if path in cards:
+                card = unique_card(cards[path])
+                if card is None:
+                    logger_city.warning(f"Каталог: цены для {path} расходятся, нужна страница товара.")
+
+            if card is not None:
+                tepl_data = {
+                    "Название": card["Название"].upper(),
+                    "Цена от": card["Цена от"],
+                    "Старая цена": card["Старая цена"],
+                    "Источник": "каталог",
+                    "Город": link_info["Город"],
+                }
+                from_catalog += 1
+                logger_city.info(f"Каталог: {link_info['Название']} = {card['Цена от']}")
+            elif fallback is not None:
+                tepl_data = fallback(link_info)
+                if tepl_data:
+                    tepl_data["Источник"] = "страница товара"
+            else:
+                tepl_data = None
+                logger_city.warning(f"Каталог: нет карточки для {link_info['Название']}.")
+
+            results[idx] = tepl_data
+            if on_result is not None:
+                on_result(link_info, tepl_data)
+
+    logging.info(f"Каталог: из карточек {from_catalog}, со страниц товаров {len(links) - from_catalog}.")
+    return [results[idx] for idx in sorted(results) if results[idx]]
@@ -0,0 +1,84 @@
+import logging
+import os
+import time
+
+from result_sink import NdjsonSink, iter_ndjson, iter_ndjson_at, index_ndjson, write_json_array
+
+#########################################
+# 1. ЖУРНАЛ ПРОГРЕССА (APPEND-ONLY JSONL) #
+#########################################
+def journal_key(link_info):
+    """Одна строка CSV = одна пара (теплица, город)."""
+    return f"{link_info['Название']}|{link_info['Город']}"
+
+class ProgressJournal:
+    """
+    Журнал готовых ссылок текущего прогона: по строке JSON на каждую
+    обработанную пару (теплица, город), с flush + fsync — после падения
+    Chrome, вытеснения раннера или таймаута GitHub Actions всё сделанное
+    остаётся на диске.
+
+    resume=False — новый прогон, старый журнал переименовывается в *.prev;
+    resume=True  — продолжаем: уже записанные пары пропускаются.
+
+    fsync_interval — как часто синхронизировать файл с диском, секунды
+    (0 — после каждой записи). При падении теряются максимум последние
+    fsync_interval секунд — эти пары просто обработаются заново при --resume.
+    keep_data=False — в памяти держатся только ключи готовых пар, а итоговый
+    JSON строится из файла журнала (journal_to_json).
+    """
+
+    def __init__(self, path, resume=False, fsync_interval=0, keep_data=True):
+        self.path = path
+        self.keep_data = keep_data
+        self.done = {}
+        if resume and os.path.exists(path):
+            self.load()
+        elif os.path.exists(path):
+            os.replace(path, f"{path}.prev")
+        self.sink = NdjsonSink(path, fsync_interval, append=True)
+
+    def load(self):
+        # Последняя строка могла оборваться при падении — iter_ndjson её пропустит, пару переделаем
+        for entry in iter_ndjson(self.path):
+            self.done[entry["key"]] = entry["data"] if self.keep_data else None
+        logging.info(f"Журнал {self.path}: уже готово {len(self.done)} пар (теплица, город).")
+
+    def is_done(self, link_info):
+        return journal_key(link_info) in self.done
+
+    def pending(self, links):
+        return [link_info for link_info in links if not self.is_done(link_info)]
+
+    def record(self, link_info, data):
+        """Записывает результат одной ссылки (data=None — не удалось извлечь)."""
+        key = journal_key(link_info)
+        entry = {"key": key, "URL": link_info["URL"], "finished_at": time.time(), "data": data}
+        self.sink.write(entry)
+        self.done[key] = data if self.keep_data else None
+
+    def collect(self, links):
+        """Итоговый all_data в порядке CSV: и восстановленные, и новые записи (только при keep_data)."""
+        all_data = []
+        for link_info in links:
+            data = self.done.get(journal_key(link_info))
+            if data:
+                all_data.append(data)
+        return all_data
+
+    def close(self):
+        self.sink.close()
+
+def journal_to_json(path, dst, links):
+    """
+    Итоговый JSON из журнала в порядке CSV (links), а не в порядке готовности
+    страниц: записи читаются из файла по смещениям строк, в памяти их нет.
+    У пары, записанной несколько раз (--retry-failed), берётся последняя запись;
+    пары не из links (CSV изменился между прогонами) — в конце.
+    Возвращает число записей.
+    """
+    offsets = index_ndjson(path, "key")
+    ordered = [offsets.pop(key) for key in dict.fromkeys(map(journal_key, links)) if key in offsets]
+    ordered += sorted(offsets.values())
+    records = (entry.get("data") for entry in iter_ndjson_at(path, ordered))
+    return write_json_array((record for record in records if record), dst)
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from catalog_listing import item_path, parse_catalog_cards
+from teplitsa_parser import HTML_PARSER, cell_text, fetch_html, setup_session
+
+BASE_URL = "https://teplitsa-rus.ru/"
+# Город основного домена: его ссылки — https://teplitsa-rus.ru/item/.../?city=msk
+MAIN_CITY = "msk"
+LOC_RE = re.compile(r"<loc>\s*([^<\s]+)\s*</loc>", re.IGNORECASE)
+
+PRODUCTS_CSV = "links].csv"
+CITIES_CSV = "city_codes.csv"
+MATRIX_CSV = "teplicy_links_final.csv"
+MATRIX_FIELDS = ["Название", "Город", "ГородКод", "URL"]
+
+#########################################
+# 1. РАЗБОР КАТАЛОГА И SITEMAP            #
+#########################################
+def product_url(city_code, path):
+    """Ссылка на товар в городе — как в teplicy_links_final.csv (ср. construct_url в parse_teplitsa_belgorod.py)."""
+    if city_code == MAIN_CITY:
+        return f"{BASE_URL}{path}?city={city_code}"
+    return f"https://{city_code}.teplitsa-rus.ru/{path}"
+
+def parse_city_list(html):
+    """Города из окна выбора города (li.city-name a): [(Город, ГородКод), ...]."""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    cities = []
+    for link in soup.select("li.city-name a"):
+        href = link.get("href") or ""
+        host = urlsplit(href).netloc
+        if host.endswith(".teplitsa-rus.ru"):
+            code = host.split(".")[0]
+        else:
+            # Основной домен: ?city=msk (в сохранённой странице — index.html%3Fcity=msk.html)
+            match = re.search(r"city=([a-z-]+)", href.replace("%3F", "?").replace("%3D", "="))
+            code = match.group(1) if match else None
+        if code:
+            cities.append((cell_text(link), code))
+    return cities
+
+def parse_sitemap(xml, base_url=BASE_URL):
+    """<loc> из sitemap: (пути товаров item/.../, ссылки на вложенные sitemap)."""
+    paths, nested = [], []
+    for loc in LOC_RE.findall(xml):
+        loc = urljoin(base_url, loc)
+        if urlsplit(loc).path.endswith(".xml"):
+            nested.append(loc)
+            continue
+        path = item_path(loc)
+        if path is not None and parse_qs(urlsplit(loc).query).get("city") in (None, [MAIN_CITY]):
+            paths.append(path)
+    return paths, nested
+
+def fetch_catalog(session, url, catalog_file=None):
+    """Каталог (главная страница, структура как в index.html): ({путь: название}, [(Город, код)])."""
+    logger = logging.getLogger()
+    if catalog_file:
+        with open(catalog_file, encoding="utf-8") as f:
+            html = f.read()
+    else:
+        status, html = fetch_html(session, url, logger)
+        if status != 200 or not html:
+            logging.warning(f"Каталог {url} недоступен ({status}).")
+            return {}, []
+    cards = parse_catalog_cards(html)
+    return {path: found[0]["Название"] for path, found in cards.items()}, parse_city_list(html)
+
+def fetch_sitemap(session, url, workers=4):
+    """Пути товаров из sitemap.xml (и вложенных sitemap); нет sitemap — пустой список."""
+    logger = logging.getLogger()
+    paths, pending, seen = [], [url], set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending:
+            batch = [u for u in pending if u not in seen]
+            seen.update(batch)
+            pending = []
+            for status, xml in executor.map(lambda u: fetch_html(session, u, logger), batch):
+                if status != 200 or not xml:
+                    continue
+                found, nested = parse_sitemap(xml)
+                paths.extend(found)
+                pending.extend(nested)
+    if not seen or not paths:
+        logging.info(f"Sitemap {url}: товаров не найдено.")
+    return list(OrderedDict.fromkeys(paths))
+
+def fetch_product_name(session, path):
+    """Название товара с его страницы (h1) — для путей, найденных только в sitemap."""
+    status, html = fetch_html(session, f"{BASE_URL}{path}", logging.getLogger())
+    if status != 200 or not html:
+        return None
+    h1 = BeautifulSoup(html, HTML_PARSER).find("h1")
+    return cell_text(h1) if h1 is not None else None
+
+def discover(base_url=BASE_URL, use_sitemap=True, catalog_file=None, workers=8):
+    """
+    Каталог и sitemap загружаются одновременно. Возвращает
+    ({путь товара: название или None}, [(Город, ГородКод), ...]).
+    """
+    session = setup_session(pool_size=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            catalog = executor.submit(fetch_catalog, session, base_url, catalog_file)
+            sitemap = None
+            if use_sitemap:
+                sitemap = executor.submit(fetch_sitemap, session, urljoin(base_url, "sitemap.xml"))
+            in_catalog, cities = catalog.result()
+            sitemap_paths = sitemap.result() if sitemap is not None else []
+    finally:
+        session.close()
+    products = OrderedDict(in_catalog)
+    for path in sitemap_paths:
+        products.setdefault(path, None)
+    logging.info(
+        f"Найдено: товаров {len(products)} (в каталоге {len(in_catalog)}, в sitemap {len(sitemap_paths)}), "
+        f"городов {len(cities)}."
+    )
+    return products, cities
+
+#########################################
+# 2. ИНКРЕМЕНТАЛЬНАЯ МАТРИЦА ТОВАР × ГОРОД #
+#########################################
+def read_rows(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def write_rows_if_changed(path, fieldnames, rows):
+    """Перезаписывает CSV (атомарно), только если содержимое изменилось. Возвращает True, если записал."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    text = buf.getvalue()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return True
+
+def build_matrix(rows, products, cities, prune=False):
+    """
+    rows — текущие строки матрицы, products — {путь: название}, cities — {код: город}.
+    Существующие строки не меняются (их ключи в журнале, кэше и истории те же);
+    в конец добавляются только недостающие пары (новые товары × все города,
+    новые города × все товары). prune=True — ещё и убрать пары с товарами
+    и городами, которых больше нет. Возвращает (строки, добавлено, удалено).
+    """
+    kept, existing, removed = [], set(), 0
+    for row in rows:
+        key = (item_path(row["URL"]), row["ГородКод"])
+        if prune and (key[0] not in products or key[1] not in cities):
+            removed += 1
+            continue
+        kept.append(row)
+        existing.add(key)
+
+    added = 0
+    for path, name in products.items():
+        for code, city in cities.items():
+            if (path, code) not in existing:
+                kept.append({"Название": name, "Город": city, "ГородКод": code, "URL": product_url(code, path)})
+                existing.add((path, code))
+                added += 1
+    return kept, added, removed
+
+def update_matrix(base_url=BASE_URL, use_sitemap=True, catalog_file=None, prune=False, dry_run=False,
+                  products_csv=PRODUCTS_CSV, cities_csv=CITIES_CSV, matrix_csv=MATRIX_CSV, workers=8):
+    """
+    Обнаружение товаров и городов + обновление links].csv, city_codes.csv
+    и teplicy_links_final.csv. Возвращает (добавлено, удалено) строк матрицы.
+    """
+    started = time.monotonic()
+    found_products, found_cities = discover(base_url, use_sitemap, catalog_file, workers)
+
+    # Известные товары и города сохраняют свои названия, новые дописываются в конец
+    product_rows = read_rows(products_csv)
+    products = OrderedDict((item_path(row["Ссылка"]), row["Название"]) for row in product_rows)
+    new_products = [path for path in found_products if path not in products]
+    unnamed = [path for path in new_products if not found_products[path]]
+    if unnamed:
+        session = setup_session(pool_size=workers)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                names = list(executor.map(lambda path: fetch_product_name(session, path), unnamed))
+        finally:
+            session.close()
+        found_products.update(zip(unnamed, names))
+    for path in new_products:
+        name = found_products[path] or path.rstrip("/").rsplit("/", 1)[-1]
+        products[path] = name
+        product_rows.append({"Название": name, "Ссылка": f"{BASE_URL}{path}"})
+        logging.info(f"Новый товар: {name} ({path})")
+
+    city_rows = read_rows(cities_csv)
+    cities = OrderedDict((row["Код"], row["Город"]) for row in city_rows)
+    for city, code in found_cities:
+        if code not in cities:
+            cities[code] = city
+            city_rows.append({"Город": city, "Код": code})
+            logging.info(f"Новый город: {city} ({code})")
+
+    if prune:
+        # Пропавшее из каталога убирается только при --prune и только если каталог вообще прочитан
+        if found_products:
+            products = OrderedDict((p, n) for p, n in products.items() if p in found_products)
+        if found_cities:
+            cities = OrderedDict((c, n) for c, n in cities.items() if c in {code for _, code in found_cities})
+
+    rows, added, removed = build_matrix(read_rows(matrix_csv), products, cities, prune)
+    logging.info(
+        f"Матрица: {len(rows)} строк ({len(products)} товаров × {len(cities)} городов), "
+        f"добавлено {added}, удалено {removed}, за {time.monotonic() - started:.1f} с."
+    )
+    if dry_run:
+        logging.info("--dry-run: файлы не изменены.")
+        return added, removed
+
+    for path, fields, data in (
+        (products_csv, ["Название", "Ссылка"], product_rows),
+        (cities_csv, ["Город", "Код"], city_rows),
+        (matrix_csv, MATRIX_FIELDS, rows),
+    ):
+        if write_rows_if_changed(path, fields, data):
+            logging.info(f"Обновлён '{path}'")
+    return added, removed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Обнаружение товаров и городов (каталог + sitemap) и обновление матрицы ссылок."
+    )
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--catalog-file", default=None,
+                        help="взять каталог из сохранённой страницы (например, index.html), а не с сайта")
+    parser.add_argument("--no-sitemap", action="store_true", help="не читать sitemap.xml")
+    parser.add_argument("--prune", action="store_true",
+                        help="убрать из матрицы товары и города, которых больше нет в каталоге")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что изменилось бы")
+    parser.add_argument("--workers", type=int, default=8, help="одновременных запросов")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    update_matrix(args.base_url, not args.no_sitemap, args.catalog_file, args.prune, args.dry_run,
+                  workers=args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+
+try:
+    import psutil  # необязательно: без него RSS считается по /proc (Linux)
+except ImportError:
+    psutil = None
+
+##################################
+# 1. ПАМЯТЬ CHROME (RSS)           #
+##################################
+def proc_tree_rss(root_pid):
+    """
+    Суммарный RSS (байты) процесса root_pid и всех его потомков:
+    chromedriver -> chrome -> renderer'ы, GPU-процесс и т.д.
+    None, если посчитать нельзя (нет psutil и нет /proc).
+    """
+    if psutil is not None:
+        try:
+            root = psutil.Process(root_pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # pid (comm) state ppid ... — comm может содержать пробелы и скобки
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+def driver_rss(driver):
+    try:
+        pid = driver.service.process.pid
+    except AttributeError:
+        return None
+    return proc_tree_rss(pid)
+
+##################################
+# 2. УПРАВЛЯЕМЫЙ ДРАЙВЕР           #
+##################################
+class ManagedDriver:
+    """
+    Жизненный цикл Chrome для долгого прогона.
+    - .driver — всегда живой текущий драйвер: после перезапуска его видят
+      все, кто обращается через ManagedDriver, а не старую закрытую копию;
+    - recycle после max_pages страниц или когда RSS Chrome со всеми
+      дочерними процессами превышает max_rss_mb;
+    - замена готовится заранее: за страницу до лимита (или при 90% памяти)
+      новый Chrome запускается в фоновом потоке, пока старый дорабатывает.
+    factory() — функция, создающая драйвер (setup_driver с нужным профилем).
+    max_pages=0 / max_rss_mb=0 — соответствующий лимит отключён.
+    """
+
+    def __init__(self, factory, max_pages=200, max_rss_mb=1500, name="WebDriver"):
+        self.factory = factory
+        self.max_pages = max_pages
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.name = name
+        self.current = None
+        self.pages = 0
+        self.recycles = 0
+        self.spare = None
+        self.spare_thread = None
+        self.spare_error = None
+
+    @property
+    def driver(self):
+        if self.current is None:
+            self.current = self.take_spare() or self.factory()
+            self.pages = 0
+            logging.info(f"{self.name}: запущен.")
+        return self.current
+
+    ##### Фоновый прогрев замены #####
+    def warm_spare(self):
+        if self.spare is not None or self.spare_thread is not None:
+            return
+        logging.info(f"{self.name}: готовим замену в фоне.")
+
+        def start():
+            try:
+                self.spare = self.factory()
+            except Exception as e:
+                self.spare_error = e
+
+        self.spare_thread = threading.Thread(target=start, daemon=True)
+        self.spare_thread.start()
+
+    def take_spare(self):
+        if self.spare_thread is not None:
+            self.spare_thread.join()
+            self.spare_thread = None
+        if self.spare_error is not None:
+            logging.warning(f"{self.name}: замену запустить не удалось: {self.spare_error}")
+            self.spare_error = None
+        spare, self.spare = self.spare, None
+        return spare
+
+    ##### Перезапуск #####
+    def quit_current(self):
+        if self.current is None:
+            return
+        try:
+            self.current.quit()
+        except Exception as e:
+            logging.warning(f"{self.name}: ошибка при закрытии: {e}")
+        self.current = None
+
+    def restart(self):
+        """Закрывает текущий Chrome (даже упавший) и переключается на новый."""
+        self.quit_current()
+        self.recycles += 1
+        return self.driver
+
+    def page_done(self):
+        """Вызывается после каждой страницы: проверка лимитов страниц и памяти."""
+        if self.current is None:
+            return
+        self.pages += 1
+        rss = driver_rss(self.current) if self.max_rss else None
+
+        if self.max_pages and self.pages >= self.max_pages:
+            logging.info(f"{self.name}: {self.pages} страниц, перезапуск.")
+            self.restart()
+        elif rss is not None and rss >= self.max_rss:
+            logging.info(f"{self.name}: RSS {rss // (1024 * 1024)} МБ, перезапуск.")
+            self.restart()
+        elif (self.max_pages and self.pages >= self.max_pages - 1) or (
+            rss is not None and rss >= 0.9 * self.max_rss
+        ):
+            self.warm_spare()
+
+    def quit(self):
+        self.quit_current()
+        spare = self.take_spare()
+        if spare is not None:
+            spare.quit()
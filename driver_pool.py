@@ -0,0 +1,144 @@
+import contextlib
+import logging
+import multiprocessing
+import queue
+import random
+import threading
+import time
+
+from teplitsa_parser import setup_driver, setup_logging, extract_teplitsa_data
+from run_metrics import RunMetrics
+from driver_manager import ManagedDriver
+from rate_limiter import shared_across_processes
+
+# Сигнал «задач больше нет» для воркера
+STOP = None
+
+##################################
+# 1. ОБРАБОТКА ОДНОЙ ССЫЛКИ        #
+##################################
+def process_link(driver, link_info, metrics=None, city=None, limiter=None, memo=None):
+    """То же, что тело цикла в teplitsa_parser.main, для одного воркера."""
+    city_name = link_info["Город"]
+    logger_city = setup_logging(city_name)
+    logger_city.info(f"\nНачинаем обработку: {link_info['Название']} (город: {city_name})")
+
+    tepl_data = extract_teplitsa_data(driver, link_info["URL"], logger_city, metrics=metrics, city=city,
+                                      limiter=limiter, memo=memo)
+    if tepl_data:
+        tepl_data["Город"] = city_name
+        logger_city.info(f"Данные для {link_info['Название']} ({city_name}) извлечены.")
+    else:
+        logger_city.warning(f"Не удалось извлечь данные для {link_info['Название']} ({city_name}).")
+
+    # Без лимитера — пауза между страницами одного браузера, как в последовательном цикле
+    if limiter is None:
+        time.sleep(random.uniform(1, 2))
+    return tepl_data
+
+def worker_loop(worker_id, tasks, results, chromedriver_path=None, city=None, browser=None, recycle=None,
+                limiter=None, memo=None):
+    """
+    Воркер: свой Chrome, задачи (index, link_info) из общей очереди,
+    результаты (index, data, замеры) — в общую очередь результатов.
+    Один и тот же код для потоков и для процессов: замеры копятся
+    в своём RunMetrics воркера и уходят вместе с результатом.
+    city — CityPreset: у каждого воркера своя копия (свой браузер — свои cookie).
+    browser — параметры setup_driver (lean, blocked_urls),
+    recycle — лимиты ManagedDriver (max_pages, max_rss_mb).
+    limiter — HostRateLimiter: общий для всех воркеров (у процессов — прокси общего лимитера).
+    memo — CharacteristicsMemo: у потоков общая, у процессов — своя копия.
+    """
+    metrics = RunMetrics()
+    city = city.fresh() if city is not None else None
+    driver = ManagedDriver(
+        lambda: setup_driver(chromedriver_path, **(browser or {})),
+        name=f"Воркер #{worker_id}",
+        **(recycle or {}),
+    )
+    driver.driver  # запускаем Chrome сразу, а не на первой странице
+    logging.info(f"Воркер #{worker_id}: WebDriver запущен.")
+    try:
+        while True:
+            task = tasks.get()
+            if task is STOP:
+                break
+            idx, link_info = task
+            try:
+                data = process_link(driver, link_info, metrics, city, limiter, memo)
+            except Exception as e:
+                logging.error(f"Воркер #{worker_id}: ошибка на {link_info['URL']}: {e}")
+                data = None
+            results.put((idx, data, metrics.take()))
+    finally:
+        driver.quit()
+        logging.info(f"Воркер #{worker_id}: WebDriver закрыт.")
+
+##################################
+# 2. ПУЛ ВОРКЕРОВ                  #
+##################################
+def run_driver_pool(links, workers=4, mode="thread", chromedriver_path=None, on_result=None, metrics=None,
+                    city=None, browser=None, recycle=None, limiter=None, memo=None):
+    """
+    Обходит links пулом из workers браузеров.
+    mode="thread"  — воркеры-потоки (браузеры и так отдельные процессы Chrome);
+    mode="process" — воркеры-процессы: разбор HTML в одном не тормозит навигацию в другом.
+    on_result(link_info, data) вызывается в главном потоке по мере поступления результатов.
+    metrics — RunMetrics прогона, в него сливаются замеры воркеров.
+    city — CityPreset (режим --wait targeted), копируется в каждый воркер.
+    browser — параметры setup_driver для всех воркеров (профиль Chrome),
+    recycle — лимиты перезапуска Chrome в каждом воркере (ManagedDriver).
+    limiter — HostRateLimiter: скорость запросов к поддоменам вместо паузы после страницы
+    (в режиме процессов — один на все процессы, через shared_across_processes),
+    memo — CharacteristicsMemo: характеристики товара один раз на все города.
+    Возвращает all_data в порядке links.
+    """
+    shared_limiter = contextlib.nullcontext(limiter)
+    if mode == "process":
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        spawn = multiprocessing.Process
+        if limiter is not None:
+            shared_limiter = shared_across_processes(limiter)
+    else:
+        tasks = queue.Queue()
+        results = queue.Queue()
+        spawn = threading.Thread
+
+    for idx, link_info in enumerate(links):
+        tasks.put((idx, link_info))
+    for _ in range(workers):
+        tasks.put(STOP)
+
+    logging.info(f"Пул браузеров: {workers} воркеров ({mode}), ссылок: {len(links)}")
+    collected = {}
+    with shared_limiter as worker_limiter:
+        pool = [
+            spawn(target=worker_loop,
+                  args=(i, tasks, results, chromedriver_path, city, browser, recycle, worker_limiter, memo),
+                  daemon=True)
+            for i in range(workers)
+        ]
+        for w in pool:
+            w.start()
+
+        # Собираем результаты; если все воркеры умерли раньше времени — не ждём вечно
+        while len(collected) < len(links):
+            try:
+                idx, data, records = results.get(timeout=5)
+                collected[idx] = data
+                if metrics is not None:
+                    metrics.extend(records)
+                if on_result is not None:
+                    on_result(links[idx], data)
+            except queue.Empty:
+                if not any(w.is_alive() for w in pool):
+                    logging.error(
+                        f"Все воркеры завершились, получено {len(collected)} из {len(links)} результатов."
+                    )
+                    break
+
+        for w in pool:
+            w.join()
+
+    return [collected[idx] for idx in sorted(collected) if collected[idx]]
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+#########################################
+# 1. КЭШ СТРАНИЦ НА ДИСКЕ                 #
+#########################################
+class PageCache:
+    """
+    Кэш HTML-страниц между запусками.
+    Тела лежат в <folder>/bodies/<hash[:2]>/<sha256>.html (content-addressed:
+    одинаковые страницы разных городов хранятся один раз), индекс по URL —
+    в <folder>/index.sqlite: хэш тела, ETag / Last-Modified, время загрузки,
+    время последнего обращения и уже разобранная запись (parsed).
+    """
+
+    def __init__(self, folder="page_cache", max_bytes=500 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.join(folder, "bodies"), exist_ok=True)
+        # Кэш трогают и из потоков разбора (async-режим) — одна блокировка на всё
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(folder, "index.sqlite"), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                parsed TEXT
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+        self.conn.commit()
+
+    def body_path(self, body_hash):
+        return os.path.join(self.folder, "bodies", body_hash[:2], f"{body_hash}.html")
+
+    def lookup(self, url):
+        """Запись индекса для url или None (просроченные по TTL не возвращаются)."""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None or time.time() - row["fetched_at"] > self.ttl_seconds:
+            return None
+        return dict(row)
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since для повторной проверки страницы."""
+        entry = self.lookup(url)
+        if entry is None or not os.path.exists(self.body_path(entry["body_hash"])):
+            return {}
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_body(self, url):
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        try:
+            with open(self.body_path(entry["body_hash"]), encoding="utf-8") as f:
+                body = f.read()
+        except OSError:
+            return None
+        with self.lock:
+            self.conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+        return body
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Сохраняет свежий ответ 200. Возвращает True, если тело изменилось
+        с прошлого раза (или страницы в кэше не было).
+        """
+        body_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        path = self.body_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute("SELECT body_hash, parsed FROM pages WHERE url = ?", (url,)).fetchone()
+            changed = old is None or old["body_hash"] != body_hash
+            parsed = None if changed else old["parsed"]
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO pages
+                    (url, body_hash, size, etag, last_modified, fetched_at, accessed_at, parsed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (url, body_hash, len(body.encode("utf-8")), etag, last_modified, now, now, parsed),
+            )
+            self.conn.commit()
+        return changed
+
+    def mark_fresh(self, url):
+        """Ответ 304: страница не изменилась, продлеваем запись."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+            self.conn.commit()
+
+    def cached_parsed(self, url):
+        """Разобранная запись для неизменившейся страницы (или None)."""
+        entry = self.lookup(url)
+        if entry is None or entry["parsed"] is None:
+            return None
+        return json.loads(entry["parsed"])
+
+    def save_parsed(self, url, data):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE pages SET parsed = ? WHERE url = ?", (json.dumps(data, ensure_ascii=False), url)
+            )
+            self.conn.commit()
+
+    def evict(self):
+        """
+        Удаляет записи старше TTL, затем самые давно использованные (LRU),
+        пока суммарный размер тел не станет меньше max_bytes.
+        Файлы тел удаляются, когда на них больше не ссылается ни один URL.
+        Возвращает число удалённых записей.
+        """
+        removed = 0
+        with self.lock:
+            cur = self.conn.execute(
+                "DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            removed += cur.rowcount
+
+            # Размер считаем по уникальным телам — одно тело может быть у нескольких URL
+            total = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT body_hash, size FROM pages)"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.conn.execute(
+                    "SELECT url, body_hash, size FROM pages ORDER BY accessed_at"
+                ).fetchall()
+                for row in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM pages WHERE url = ?", (row["url"],))
+                    removed += 1
+                    still_used = self.conn.execute(
+                        "SELECT 1 FROM pages WHERE body_hash = ? LIMIT 1", (row["body_hash"],)
+                    ).fetchone()
+                    if still_used is None:
+                        total -= row["size"]
+            self.conn.commit()
+
+            used = {r[0] for r in self.conn.execute("SELECT DISTINCT body_hash FROM pages")}
+
+        for root, _dirs, files in os.walk(os.path.join(self.folder, "bodies")):
+            for name in files:
+                if name.endswith(".html") and name[:-5] not in used:
+                    os.remove(os.path.join(root, name))
+        return removed
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
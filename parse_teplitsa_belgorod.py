@@ -1,4 +1,3 @@
-import json
 import time
 import re
 import random  # Добавленный импорт
@@ -10,6 +9,7 @@ from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
+from result_sink import NdjsonSink, ndjson_to_json
 
 # Настройка логирования
 logging.basicConfig(
@@ -212,7 +212,8 @@ def main():
     ]
     driver = setup_driver()
     logging.info("WebDriver успешно запущен.")
-    all_data = []
+    # Результаты сразу пишем построчно (NDJSON), в памяти не копим
+    sink = NdjsonSink("teplicy_belgorod_data.jsonl")
     for city_name, city_code in cities.items():
         logging.info(f"\nОбработка города: {city_name}")
         print(f"\nОбработка города: {city_name}")  # Сохраняем также для консоли
@@ -221,7 +222,7 @@ def main():
             data = extract_teplitsa_data(driver, url)
             if data:
                 data["Город"] = city_name
-                all_data.append(data)
+                sink.write(data)
             else:
                 logging.warning(f"Данные для теплицы по ссылке {url} не получены.")
                 print(f"Данные для теплицы по ссылке {url} не получены.")  # Сохраняем также для консоли
@@ -230,9 +231,9 @@ def main():
     driver.quit()
     logging.info("\nWebDriver закрыт.")
     print("\nWebDriver закрыт.")  # Сохраняем также для консоли
+    sink.close()
     try:
-        with open("teplicy_belgorod_data.json", "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
+        ndjson_to_json("teplicy_belgorod_data.jsonl", "teplicy_belgorod_data.json")
         logging.info("Сбор данных завершен. Результат сохранен в 'teplicy_belgorod_data.json'.")
         print("Сбор данных завершен. Результат сохранен в 'teplicy_belgorod_data.json'.")
     except Exception as e:
@@ -1,4 +1,5 @@
 import json
+import gzip
 import requests
 import os
 import csv
@@ -6,6 +7,8 @@ import re
 import time
 import random
 import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
@@ -17,6 +20,21 @@ from selenium.common.exceptions import (
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
+from teplitsa_parser import (
+    HTML_PARSER,
+    setup_session,
+    fetch_html,
+    cell_text,
+    is_html_page_available,
+    has_required_elements,
+)
+from checkpoint import ProgressJournal
+from result_sink import write_json_array
+from sharding import merge_shards, parse_shard, select_shard, shard_suffix
+from rate_limiter import HostRateLimiter
+from retry_queue import RetryQueue, read_dead_letter, write_dead_letter
+from url_resolver import resolve_links
+from preflight import NegativeCache, remember_soft_404, run_preflight, soft_404_candidates
 
 ###########################
 # НАСТРОЙКА SELENIUM DRIVER
@@ -71,6 +89,26 @@ def read_links_from_csv(csv_file):
 ###################################
 # ИЗВЛЕЧЕНИЕ ХАРАКТЕРИСТИК (ПРИМЕР)
 ###################################
+def parse_characteristics_html(html_desc):
+    characteristics = {}
+    soup = BeautifulSoup(html_desc, "html.parser")
+
+    # Заменим <br> на \n
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+
+    lines = [ln.strip() for ln in soup.get_text(separator="\n").split("\n") if ln.strip()]
+
+    # Пример: ищем строки вида "Каркас: оцинкованная труба..."
+    # Это пример, адаптируйте под реальную верстку
+    for line in lines:
+        match = re.match(r'([^:]+):\s*(.+)', line)
+        if match:
+            key = match.group(1).strip()
+            val = match.group(2).strip()
+            characteristics[key] = val
+    return characteristics
+
 def extract_characteristics(driver):
     characteristics = {}
     try:
@@ -81,22 +119,7 @@ def extract_characteristics(driver):
             desc_div = driver.find_element(By.CSS_SELECTOR, "div.description")
 
         html_desc = desc_div.get_attribute("innerHTML")
-        soup = BeautifulSoup(html_desc, "html.parser")
-
-        # Заменим <br> на \n
-        for br in soup.find_all("br"):
-            br.replace_with("\n")
-
-        lines = [ln.strip() for ln in soup.get_text(separator="\n").split("\n") if ln.strip()]
-
-        # Пример: ищем строки вида "Каркас: оцинкованная труба..."
-        # Это пример, адаптируйте под реальную верстку
-        for line in lines:
-            match = re.match(r'([^:]+):\s*(.+)', line)
-            if match:
-                key = match.group(1).strip()
-                val = match.group(2).strip()
-                characteristics[key] = val
+        characteristics = parse_characteristics_html(html_desc)
 
     except NoSuchElementException:
         pass
@@ -105,38 +128,50 @@ def extract_characteristics(driver):
 ##########################################
 # ИЗВЛЕЧЕНИЕ ЦЕН (ПРИМЕР) ВКЛЮЧАЯ 4 МЕТРА
 ##########################################
-def extract_prices(driver):
+def prices_from_table(table):
+    """Разбор уже полученной (BeautifulSoup) таблицы poly-price."""
     prices = {}
+    for row in table.find_all("tr"):
+        cols = row.find_all("td")
+        if len(cols) < 3:
+            continue
+
+        # Например, cols[0] = "Поликарбонат Стандарт 4мм", cols[1]="стоимость", cols[2..]=длины
+        product_type = cell_text(cols[0])
+
+        for cell in cols[2:]:
+            length_label = (cell.get("data-label") or "").strip()  # "4 метра"
+            if length_label:
+                key = f"{product_type} ({length_label})"
+                prices[key] = cell_text(cell)                 # "16990 руб."
+    return prices
+
+def extract_prices(driver):
+    # outerHTML таблицы одним запросом, дальше разбираем локально
     try:
         table = driver.find_element(By.CSS_SELECTOR, "table.tb2.adaptive.poly-price")
-        rows = table.find_elements(By.TAG_NAME, "tr")
-        for row in rows:
-            cols = row.find_elements(By.TAG_NAME, "td")
-            if len(cols) < 3:
-                continue
-
-            # Например, cols[0] = "Поликарбонат Стандарт 4мм", cols[1]="стоимость", cols[2..]=длины
-            product_type = cols[0].text.strip()
-
-            for c_idx in range(2, len(cols)):
-                cell = cols[c_idx]
-                length_label = cell.get_attribute("data-label") or ""
-                length_label = length_label.strip()  # "4 метра"
-                price_text = cell.text.strip()       # "16990 руб."
-
-                if length_label:
-                    key = f"{product_type} ({length_label})"
-                    prices[key] = price_text
+        table_html = table.get_attribute("outerHTML")
     except NoSuchElementException:
-        pass
-    return prices
+        return {}
+    soup = BeautifulSoup(table_html, HTML_PARSER)
+    return prices_from_table(soup.select_one("table"))
 
 #####################################
 # СБОР ДАННЫХ С ОДНОЙ СТРАНИЦЫ
 #####################################
-def parse_one(driver, url):
+def parse_one(driver, url, limiter=None):
     data = {}
-    driver.get(url)
+    if limiter is not None:
+        limiter.wait(url)
+    started = time.monotonic()
+    try:
+        driver.get(url)
+    except TimeoutException:
+        if limiter is not None:
+            limiter.observe(url, time.monotonic() - started, error=True)
+        raise
+    if limiter is not None:
+        limiter.observe(url, time.monotonic() - started)
 
     # Ждём body
     WebDriverWait(driver, 15).until(
@@ -173,72 +208,375 @@ def parse_one(driver, url):
 
     return data
 
+#####################################
+# СБОР ДАННЫХ БЕЗ БРАУЗЕРА (HTTP)
+#####################################
+def parse_html(soup):
+    """То же, что parse_one, но по HTML, полученному обычным GET-запросом."""
+    data = {}
+    h1 = soup.find("h1")
+    # h1 на сайте в text-transform: uppercase, Selenium отдаёт его заглавными
+    data["Название"] = cell_text(h1).upper() if h1 is not None else "Не указано"
+
+    desc_div = soup.select_one("div.prod_desc") or soup.select_one("div.description")
+    if desc_div is not None:
+        data.update(parse_characteristics_html(desc_div.decode_contents()))
+
+    table = soup.select_one("table.tb2.adaptive.poly-price")
+    prices = prices_from_table(table) if table is not None else {}
+    data["Цены"] = prices
+    return data
+
+def parse_one_http(session, url, get_driver=None, limiter=None):
+    """
+    Сначала обычный HTTP-запрос; в Selenium (parse_one) уходим,
+    только если в ответе нет h1 / блока описания / таблицы цен.
+    """
+    logger = logging.getLogger()
+    status, html = fetch_html(session, url, logger, limiter=limiter)
+    if status == 404:
+        return None
+
+    if status == 200 and html:
+        soup = BeautifulSoup(html, "html.parser")
+        if not is_html_page_available(soup, logger):
+            return None
+        if has_required_elements(soup):
+            return parse_html(soup)
+        logging.info(f"В HTML нет нужных элементов, открываем в браузере: {url}")
+
+    if get_driver is None:
+        return None
+    return parse_one(get_driver(), url, limiter)
+
 ###################################
 # ЗАПИСЬ В SUPABASE (REST API)
 ###################################
-def insert_to_supabase(all_data):
-    """Пример вставки через REST API. 
-       Нужно в GitHub Secrets прописать SUPABASE_URL и SUPABASE_SERVICE_KEY
+def chunked(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def dedupe_rows(rows, key_fields):
+    """Последняя запись на (теплица, город): upsert не может обновить одну строку дважды за запрос."""
+    unique = {}
+    for row in rows:
+        unique[tuple(row.get(k) for k in key_fields)] = row
+    return list(unique.values())
+
+def post_batch(session, endpoint, headers, batch, batch_no, retries=5, use_gzip=True):
+    """
+    Отправляет одну пачку строк. Повторяет при сетевых ошибках, 429 и 5xx
+    с экспоненциальной паузой. Возвращает словарь со статистикой пачки.
+    """
+    body = json.dumps(batch, ensure_ascii=False).encode("utf-8")
+    raw_size = len(body)
+    batch_headers = dict(headers)
+    if use_gzip:
+        body = gzip.compress(body)
+        batch_headers["Content-Encoding"] = "gzip"
+
+    started = time.monotonic()
+    status = None
+    for attempt in range(1, retries + 1):
+        try:
+            resp = session.post(endpoint, headers=batch_headers, data=body, timeout=60)
+            status = resp.status_code
+            if status < 400:
+                break
+            if status != 429 and status < 500:
+                # Ошибка в данных/схеме — повтор не поможет
+                logging.error(f"Пачка #{batch_no}: {status} {resp.text[:500]}")
+                break
+            logging.warning(f"Пачка #{batch_no}: {status}, попытка {attempt}/{retries}.")
+        except requests.RequestException as e:
+            logging.warning(f"Пачка #{batch_no}: {e}, попытка {attempt}/{retries}.")
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+    elapsed = time.monotonic() - started
+    ok = status is not None and status < 400
+    logging.info(
+        f"Пачка #{batch_no}: строк {len(batch)}, {raw_size} -> {len(body)} байт, "
+        f"статус {status}, попыток {attempt}, {elapsed:.2f} с."
+    )
+    return {"batch": batch_no, "rows": len(batch), "status": status, "ok": ok,
+            "attempts": attempt, "seconds": round(elapsed, 3), "bytes": len(body)}
+
+def insert_to_supabase(all_data, batch_size=500, concurrency=4, retries=5, use_gzip=True,
+                       on_conflict="Название,Город"):
+    """Upsert через REST API пачками.
+       Нужно в GitHub Secrets прописать SUPABASE_URL и SUPABASE_SERVICE_KEY.
+       Строки с тем же (Название, Город) обновляются (merge-duplicates),
+       пачки уходят параллельно (не больше concurrency одновременно) с повторами.
+       Возвращает список статистик по пачкам.
     """
-    import requests
-
     SUPABASE_URL = os.environ["SUPABASE_URL"]   # secrets
     SUPABASE_SERVICE_KEY = os.environ["SUPABASE_SERVICE_KEY"]  # secrets
     TABLE_NAME = "prices"  # ваша таблица
-    
-    endpoint = f"{SUPABASE_URL}/rest/v1/{TABLE_NAME}"
+
+    endpoint = f"{SUPABASE_URL}/rest/v1/{TABLE_NAME}?on_conflict={on_conflict}"
     headers = {
         "apikey": SUPABASE_SERVICE_KEY,
         "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
         "Content-Type": "application/json",
-        # "Prefer": "resolution=merge-duplicates"  # если нужен upsert
+        "Prefer": "resolution=merge-duplicates,return=minimal",
     }
 
-    resp = requests.post(endpoint, headers=headers, json=all_data)
-    print("Status:", resp.status_code, "Resp:", resp.text)
+    rows = dedupe_rows(all_data, on_conflict.split(","))
+    batches = list(chunked(rows, batch_size))
+    logging.info(f"Supabase: {len(rows)} строк, {len(batches)} пачек по {batch_size}, параллельно {concurrency}.")
+
+    session = setup_session(pool_size=concurrency)
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(post_batch, session, endpoint, headers, batch, no, retries, use_gzip)
+                for no, batch in enumerate(batches, start=1)
+            ]
+            stats = [f.result() for f in futures]
+    finally:
+        session.close()
+
+    sent = sum(st["rows"] for st in stats if st["ok"])
+    failed = [st["batch"] for st in stats if not st["ok"]]
+    logging.info(f"Supabase: записано {sent} из {len(rows)} строк за {time.monotonic() - started:.2f} с.")
+    if failed:
+        logging.error(f"Supabase: не удалось отправить пачки {failed}.")
+    return stats
 
 ############################
 # ОСНОВНАЯ ФУНКЦИЯ main
 ############################
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Парсинг теплиц и загрузка в Supabase.")
+    parser.add_argument(
+        "--fetch",
+        choices=["browser", "http"],
+        default="browser",
+        help="browser — всё через Chrome; http — обычные запросы, Chrome только как запасной вариант",
+    )
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="обойти только шард i из N (0..N-1), например 0/4 — для матрицы в CI")
+    parser.add_argument("--shard-by", choices=["city", "product"], default="city",
+                        help="как делить ссылки: по городам (по умолчанию) или по хэшу теплицы")
+    parser.add_argument("--output", default=None,
+                        help="сохранить собранные записи в JSON (результат шарда для sharding.py)")
+    parser.add_argument("--no-upload", action="store_true",
+                        help="не загружать в Supabase (шард в матрице: загрузку делает шаг слияния)")
+    parser.add_argument("--upload-from", nargs="+", default=None, metavar="FILE",
+                        help="не парсить, а загрузить готовые результаты (после слияния и проверки)")
+    parser.add_argument("--throttle", choices=["adaptive", "fixed"], default="adaptive",
+                        help="adaptive — лимит запросов на поддомен по задержкам, 429 / 5xx и Retry-After; "
+                             "fixed — пауза 1–2 с после каждой страницы")
+    parser.add_argument("--host-rate", type=float, default=1.0,
+                        help="adaptive: начальная скорость, запросов в секунду на поддомен")
+    parser.add_argument("--host-max-rate", type=float, default=4.0,
+                        help="adaptive: потолок скорости, запросов в секунду на поддомен")
+    parser.add_argument("--dedupe", choices=["off", "redirect", "canonical"], default="redirect",
+                        help="обходить страницу один раз на все строки, что ведут в неё: redirect — по "
+                             "редиректам (HEAD), canonical — ещё и по <link rel=canonical>; off — не проверять. "
+                             "Это ещё по запросу на каждый URL (с предварительной проверкой — один на оба), "
+                             "через лимитер поддоменов, до 4 одновременно на поддомен")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="не проверять URL перед обходом (HEAD/GET через лимитер поддоменов) и не пропускать известные 404")
+    parser.add_argument("--dead-cache", default=None,
+                        help="негативный кэш 404 (JSON), по умолчанию parser[_shardIofN]_dead_urls.json")
+    parser.add_argument("--dead-ttl-days", type=float, default=7,
+                        help="сколько дней не запрашивать URL, ответивший 404")
+    parser.add_argument("--retry-rounds", type=int, default=3,
+                        help="сколько раундов повторов неудачных ссылок после основного прохода")
+    parser.add_argument("--retry-delay", type=float, default=10,
+                        help="пауза перед первым раундом повторов, секунды (дальше — вдвое больше)")
+    parser.add_argument("--dead-letter", default=None,
+                        help="ссылки, не извлечённые и после повторов (NDJSON), "
+                             "по умолчанию parser[_shardIofN]_dead_letter.jsonl")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="обойти только ссылки из dead-letter файла; удачные дописываются в журнал")
+    parser.add_argument("--journal", default=None,
+                        help="журнал прогресса (JSONL): каждая готовая пара (теплица, город); "
+                             "по умолчанию parser[_shardIofN]_progress.jsonl")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный прогон: пропустить пары из журнала")
+    parser.add_argument("--fsync-interval", type=float, default=5,
+                        help="как часто синхронизировать журнал с диском, секунды (0 — после каждой страницы)")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="Supabase: строк в одном запросе")
+    parser.add_argument("--upload-concurrency", type=int, default=4,
+                        help="Supabase: сколько пачек отправлять одновременно")
+    parser.add_argument("--upload-retries", type=int, default=5,
+                        help="Supabase: попыток на пачку")
+    parser.add_argument("--no-gzip", action="store_true",
+                        help="Supabase: не сжимать тело запроса")
+    parser.add_argument("--history", default=None,
+                        help="файл истории цен SQLite (см. price_history.py); без флага не пишется. "
+                             "В ночном workflow история пишется в задаче upload из merged.json "
+                             "(price_history.py import) и хранится в кэше Actions")
+    return parser.parse_args(argv)
+
+def upload(all_data, args):
+    if all_data:
+        insert_to_supabase(all_data, args.batch_size, args.upload_concurrency, args.upload_retries,
+                           use_gzip=not args.no_gzip)
+    else:
+        logging.warning("all_data пустой, нет данных для записи.")
+
+def main(argv=None):
+    args = parse_args(argv)
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+    # Загрузка уже слитых результатов шардов, без парсинга
+    if args.upload_from:
+        all_data, invalid, duplicates = merge_shards(args.upload_from)
+        if invalid:
+            logging.warning(f"Отброшено невалидных записей: {len(invalid)}.")
+        logging.info(f"К загрузке {len(all_data)} записей (дубликатов {duplicates}).")
+        upload(all_data, args)
+        return
+
     # 1. Читаем CSV
     csv_file = "teplicy_links_final.csv"  # Убедитесь, что лежит в репо
     links = read_links_from_csv(csv_file)
     logging.info(f"Всего ссылок для парсинга: {len(links)}")
-
-    # 2. Настройка Selenium
-    driver = setup_driver()
-
-    # 3. Парсим
-    all_data = []
-    for ln in links:
-        city = ln["Город"]
-        url = ln["URL"]
-        name = ln["Название"]
-        logging.info(f"Парсим: {name} / {city} => {url}")
-
-        one_data = parse_one(driver, url)
-        if one_data:
-            # Добавим поле Город, если нужно
-            one_data["Город"] = city
-            all_data.append(one_data)
-        else:
-            logging.warning(f"Не удалось извлечь данные: {name} / {city}")
-
-        time.sleep(random.uniform(1, 2))
-
-    driver.quit()
+    if args.shard:
+        links = select_shard(links, args.shard, args.shard_by)
+
+    journal_path = args.journal or f"parser{shard_suffix(args.shard)}_progress.jsonl"
+    dead_letter_path = args.dead_letter or f"parser{shard_suffix(args.shard)}_dead_letter.jsonl"
+    # --retry-failed: журнал прошлого прогона продолжается, обходятся только ссылки из dead-letter
+    journal = ProgressJournal(journal_path, resume=args.resume or args.retry_failed,
+                              fsync_interval=args.fsync_interval)
+    if args.retry_failed:
+        pending = read_dead_letter(dead_letter_path)
+        logging.info(f"--retry-failed: {len(pending)} ссылок из '{dead_letter_path}'.")
+    else:
+        pending = journal.pending(links)
+    if args.resume and not args.retry_failed:
+        logging.info(f"--resume: уже готово {len(links) - len(pending)}, осталось {len(pending)}.")
+
+    # 2. Настройка Selenium (в HTTP-режиме — лениво, при первом fallback)
+    driver = None
+
+    def get_driver():
+        nonlocal driver
+        if driver is None:
+            driver = setup_driver()
+        return driver
+
+    limiter = None
+    if args.throttle == "adaptive":
+        limiter = HostRateLimiter(args.host_rate, max_rate=args.host_max_rate)
+
+    session = setup_session() if args.fetch == "http" else None
+    if session is None:
+        get_driver()
+
+    # 3. Парсим. Ошибка на странице не повторяется сразу: ссылка откладывается
+    # в очередь повторов и обходится снова после основного прохода
+    failed_urls = set()
+    # Страницы без ошибки, но и без данных — 404 по title / h1; и страницы, что разобрались
+    not_found = set()
+    parsed_urls = set()
+
+    def crawl(links_to_parse, on_result):
+        nonlocal driver
+        for ln in links_to_parse:
+            city = ln["Город"]
+            url = ln["URL"]
+            name = ln["Название"]
+            logging.info(f"Парсим: {name} / {city} => {url}")
+
+            failed_urls.discard(url)
+            try:
+                if session is not None:
+                    one_data = parse_one_http(session, url, get_driver, limiter)
+                else:
+                    one_data = parse_one(get_driver(), url, limiter)
+            except (TimeoutException, WebDriverException) as e:
+                logging.error(f"Ошибка на {url}: {e}")
+                failed_urls.add(url)
+                one_data = None
+                if not isinstance(e, TimeoutException) and driver is not None:
+                    # Chrome мог упасть — следующая страница откроется в новом
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+                    driver = None
+            if one_data:
+                # Добавим поле Город, если нужно
+                one_data["Город"] = city
+                parsed_urls.add(url)
+                not_found.discard(url)
+            else:
+                logging.warning(f"Не удалось извлечь данные: {name} / {city}")
+                if url not in failed_urls:
+                    not_found.add(url)
+            on_result(ln, one_data)
+
+            if limiter is None:
+                time.sleep(random.uniform(1, 2))
+
+    def is_failed(ln):
+        return ln["URL"] in failed_urls
+
+    # Предварительная проверка: 404 — в негативный кэш и мимо обхода до истечения TTL
+    checked = None
+    dead_cache = None
+    if not args.no_preflight and pending:
+        dead_cache = NegativeCache(args.dead_cache or f"parser{shard_suffix(args.shard)}_dead_urls.json",
+                                   args.dead_ttl_days * 24 * 3600)
+        pending, skipped, checked = run_preflight(pending, dead_cache, canonical=args.dedupe == "canonical",
+                                                  limiter=limiter)
+        for ln in skipped:
+            journal.record(ln, None)
+
+    # Строки с одной и той же страницей (редирект / canonical) — один обход на группу
+    record = journal.record
+    groups = None
+    if args.dedupe != "off" and pending:
+        groups = resolve_links(pending, canonical=args.dedupe == "canonical", checked=checked, limiter=limiter)
+        pending = groups.representatives()
+        record = groups.fan_out(journal.record)
+
+    retry_queue = RetryQueue(args.retry_rounds, args.retry_delay)
+    crawl(pending, retry_queue.wrap(record, is_failed))
+    dead = retry_queue.run(crawl, record, is_failed)
+    for ln in dead:
+        record(ln, None)
+    if groups is not None:
+        dead = groups.expand(dead)
+    if dead_cache is not None:
+        remember_soft_404(dead_cache, soft_404_candidates(sorted(not_found), checked), parsed=sorted(parsed_urls))
+    write_dead_letter(dead_letter_path, dead, retry_queue.attempts, append=args.resume and not args.retry_failed)
+
+    if limiter is not None:
+        limiter.log_summary()
+    if driver is not None:
+        driver.quit()
+    if session is not None:
+        session.close()
+
+    all_data = journal.collect(links)
+    journal.close()
 
     logging.info(f"Парсинг завершён, всего {len(all_data)} записей.")
+    if args.output:
+        write_json_array(all_data, args.output)
+        logging.info(f"Результаты сохранены в '{args.output}'")
+    if args.history:
+        from price_history import PriceHistory
+        history = PriceHistory(args.history)
+        try:
+            history.record(all_data, csv_file=csv_file)
+        finally:
+            history.close()
 
     # 4. Отправляем в Supabase
-    if all_data:
-        insert_to_supabase(all_data)
+    if args.no_upload:
+        logging.info("--no-upload: загрузка в Supabase пропущена.")
     else:
-        logging.warning("all_data пустой, нет данных для записи.")
+        upload(all_data, args)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import time
+
+from url_resolver import check_urls
+
+# Ответы, которые считаются подтверждённым «товара больше нет»
+DEAD_STATUSES = (404, 410)
+
+#########################################
+# 1. НЕГАТИВНЫЙ КЭШ (404 С TTL)            #
+#########################################
+class NegativeCache:
+    """
+    URL, про которые уже известно, что это 404 (снятый с продажи товар):
+    {url: {"dead_since", "checked_at", "soft"}} в JSON-файле. Пока с последней
+    проверки не прошло ttl секунд, URL не запрашивается вовсе; потом
+    проверяется заново — и либо остаётся в кэше, либо «оживает».
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"Негативный кэш '{path}' не прочитан ({e}), начинаем с пустого.")
+
+    def is_fresh(self, url, now=None):
+        """URL в кэше и TTL не истёк — запрашивать не нужно."""
+        entry = self.entries.get(url)
+        now = time.time() if now is None else now
+        return entry is not None and now - entry["checked_at"] < self.ttl
+
+    def mark_dead(self, url, now=None, soft=False):
+        """
+        Возвращает True, если URL умер только что (раньше в кэше его не было).
+        soft=True — сервер отвечает 200, а 404 видно только по содержимому страницы.
+        У уже известного URL сохраняется dead_since; настоящий 404 снимает признак soft.
+        """
+        now = time.time() if now is None else now
+        entry = self.entries.get(url)
+        if entry is None:
+            self.entries[url] = {"dead_since": now, "checked_at": now, "soft": soft}
+            return True
+        entry["checked_at"] = now
+        entry["soft"] = bool(entry.get("soft")) and soft
+        return False
+
+    def mark_alive(self, url, confirmed=False):
+        """
+        Убирает URL из кэша. Возвращает True, если товар действительно вернулся.
+        Для «мягкого» 404 ответ 200 на HEAD ничего не значит: запись остаётся
+        (с прежним dead_since), пока разбор страницы не покажет товар (confirmed=True)
+        или снова не найдёт 404 (remember_soft_404).
+        """
+        entry = self.entries.get(url)
+        if entry is None or (entry.get("soft") and not confirmed):
+            return False
+        del self.entries[url]
+        return True
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+#########################################
+# 2. ПРОВЕРКА ПЕРЕД ОБХОДОМ                #
+#########################################
+def run_preflight(links, cache, workers=16, canonical=False, timeout=10, limiter=None, per_host=4):
+    """
+    Проверяет все URL, кроме свежих записей негативного кэша, лёгкими
+    HEAD/GET-запросами параллельно. 404 / 410 уходят в кэш и из обхода
+    исключаются. Возвращает (живые ссылки, пропущенные ссылки, checked) —
+    checked (результат check_urls) годится и для url_resolver.resolve_links.
+    limiter — HostRateLimiter обхода: проверка идёт с той же скоростью на поддомен
+    и по 429 / Retry-After замедляется вместе с обходом; per_host — одновременных
+    запросов на поддомен.
+    """
+    now = time.time()
+    to_check = [link_info["URL"] for link_info in links if not cache.is_fresh(link_info["URL"], now)]
+    started = time.monotonic()
+    checked = check_urls(to_check, workers, canonical, timeout, limiter, per_host)
+
+    newly_dead, revived, errors = [], [], 0
+    for url, (status, _final) in checked.items():
+        if status in DEAD_STATUSES:
+            if cache.mark_dead(url, now):
+                newly_dead.append(url)
+        elif status is None:
+            errors += 1
+        elif status < 400 and cache.mark_alive(url):
+            revived.append(url)
+    cache.save()
+
+    dead = {url for url, (status, _final) in checked.items() if status in DEAD_STATUSES}
+    alive = [link_info for link_info in links if link_info["URL"] in checked and link_info["URL"] not in dead]
+    skipped = [link_info for link_info in links if link_info["URL"] not in checked or link_info["URL"] in dead]
+
+    logging.info(
+        f"Предварительная проверка: {len(checked)} URL за {time.monotonic() - started:.1f} с, "
+        f"из кэша 404 пропущено {len(links) - len(to_check)}, 404 сейчас {len(dead)}, "
+        f"без ответа {errors}; к обходу {len(alive)} из {len(links)}."
+    )
+    for url in newly_dead:
+        logging.warning(f"  Новый 404: {url}")
+    for url in revived:
+        logging.info(f"  Снова доступен: {url}")
+    return alive, skipped, checked
+
+def remember_soft_404(cache, urls, parsed=()):
+    """
+    urls — страницы, отдавшие HTTP 200, но оказавшиеся 404 по title / h1 при
+    разборе: тоже в кэш, чтобы в следующий раз не открывать их в Chrome.
+    parsed — страницы, которые разобрались: «мягкий» 404 с них снимается.
+    """
+    newly_dead = [url for url in urls if cache.mark_dead(url, soft=True)]
+    revived = [url for url in parsed if cache.mark_alive(url, confirmed=True)]
+    if urls or revived:
+        cache.save()
+    for url in newly_dead:
+        logging.warning(f"  Новый 404 (по содержимому страницы): {url}")
+    for url in revived:
+        logging.info(f"  Снова доступен: {url}")
+    return newly_dead
+
+def soft_404_candidates(urls, checked):
+    """Из 404, найденных при обходе, — те, на которые предварительная проверка получила HTTP 200."""
+    return [url for url in urls if checked.get(url, (None, None))[0] == 200]
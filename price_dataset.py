@@ -0,0 +1,165 @@
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import re
+
+from price_labels import parse_price_label, parse_price_value
+from result_sink import iter_ndjson
+
+# Колонки нормализованной таблицы цен (одна строка = одна цена)
+COLUMNS = ["product", "city", "city_code", "grade", "thickness_mm", "length_m", "price"]
+
+#########################################
+# 1. ЗАПИСИ -> СТРОКИ ТАБЛИЦЫ ЦЕН          #
+#########################################
+def read_city_codes(csv_file="teplicy_links_final.csv"):
+    """{Город: ГородКод} из того же CSV, по которому идёт обход."""
+    codes = {}
+    if not os.path.exists(csv_file):
+        logging.warning(f"Нет '{csv_file}', city_code будет пустым.")
+        return codes
+    with open(csv_file, encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            codes.setdefault(row["Город"].strip(), row["ГородКод"].strip())
+    return codes
+
+def load_records(path, field=None):
+    """Записи из итогового JSON (массив) или из NDJSON / журнала прогресса (field="data")."""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+    for entry in iter_ndjson(path):
+        record = entry.get(field) if field else entry
+        if record:
+            yield record
+
+def normalize_prices(records, city_codes):
+    """
+    Разворачивает «Цены» каждой записи в строки COLUMNS.
+    Цены «Цена отсутствует» пропускаются; ключи, которые не удалось
+    разобрать, считаются и возвращаются отдельно: (rows, {ключ: сколько раз}).
+    """
+    rows = []
+    unparsed = {}
+    for record in records:
+        city = record.get("Город")
+        for label, value in (record.get("Цены") or {}).items():
+            parsed = parse_price_label(label)
+            if parsed is None:
+                unparsed[label] = unparsed.get(label, 0) + 1
+                continue
+            price = parse_price_value(value)
+            if price is None:
+                continue
+            rows.append({
+                "product": record.get("Название"),
+                "city": city,
+                "city_code": city_codes.get(city),
+                "grade": parsed["grade"],
+                "thickness_mm": parsed["thickness_mm"],
+                "length_m": parsed["length_m"],
+                "price": price,
+            })
+    return rows, unparsed
+
+#########################################
+# 2. ЗАПИСЬ PARQUET / ARROW ПО ДАТАМ       #
+#########################################
+# Файлы раздела: prices-0.parquet (полный прогон), prices_shard1of4-0.parquet (шард)
+PART_FILE_RE = re.compile(r"^prices(_shard\d+of(\d+))?-\d+\.(parquet|arrow)$")
+
+def remove_replaced_files(partition, shard=None):
+    """
+    Удаляет из раздела даты файлы, которые заменяет текущая запись:
+    полный прогон — все файлы; шард — свои, полного прогона и шардов
+    с другим N. Файлы остальных шардов того же разбиения остаются.
+    """
+    from sharding import shard_suffix  # sharding сам импортирует этот модуль
+
+    if not os.path.isdir(partition):
+        return
+    part = shard_suffix(shard)
+    for name in os.listdir(partition):
+        match = PART_FILE_RE.match(name)
+        if match is None:
+            continue
+        own = match.group(1) or ""
+        if not shard or own in ("", part) or int(match.group(2)) != shard[1]:
+            os.remove(os.path.join(partition, name))
+
+def write_price_dataset(rows, root, run_date, fmt="parquet", shard=None):
+    """
+    Пишет строки в <root>/run_date=<YYYY-MM-DD>/ (hive-разбиение, Parquet или Arrow IPC).
+    Повторный прогон за ту же дату заменяет её раздел, другие даты не трогаются.
+    shard=(i, N) — прогон шарда (--shard): в разделе заменяются только его файлы,
+    так что шарды одной ночи складываются в один раздел, а не затирают друг друга.
+    Требуется pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise SystemExit("Для таблицы цен нужен pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ("product", pa.string()),
+        ("city", pa.string()),
+        ("city_code", pa.string()),
+        ("grade", pa.string()),
+        ("thickness_mm", pa.float32()),
+        ("length_m", pa.float32()),
+        ("price", pa.int32()),
+        ("run_date", pa.date32()),
+    ])
+    columns = {name: [row[name] for row in rows] for name in COLUMNS}
+    columns["run_date"] = [run_date] * len(rows)
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    from sharding import shard_suffix
+
+    remove_replaced_files(os.path.join(root, f"run_date={run_date.isoformat()}"), shard)
+    part = shard_suffix(shard)
+    ds.write_dataset(
+        table,
+        root,
+        format="parquet" if fmt == "parquet" else "ipc",
+        partitioning=ds.partitioning(pa.schema([("run_date", pa.date32())]), flavor="hive"),
+        basename_template=f"prices{part}-{{i}}." + ("parquet" if fmt == "parquet" else "arrow"),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return len(rows)
+
+def export_prices(records, root, run_date=None, fmt="parquet", csv_file="teplicy_links_final.csv", shard=None):
+    """
+    Полный шаг вывода: нормализация + запись раздела за run_date (по умолчанию — сегодня).
+    shard — (i, N) для прогона шарда, см. write_price_dataset.
+    """
+    run_date = run_date or datetime.date.today()
+    rows, unparsed = normalize_prices(records, read_city_codes(csv_file))
+    for label, count in sorted(unparsed.items()):
+        logging.warning(f"Таблица цен: ключ не разобран ({count} раз): {label}")
+    count = write_price_dataset(rows, root, run_date, fmt, shard)
+    logging.info(f"Таблица цен: {count} строк в '{root}' (run_date={run_date}, {fmt}).")
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Нормализованная таблица цен (Parquet / Arrow) из результатов парсера."
+    )
+    parser.add_argument("src", help="итоговый JSON, NDJSON или журнал прогресса")
+    parser.add_argument("--out", default="prices_dataset", help="папка набора данных")
+    parser.add_argument("--run-date", default=None, help="дата прогона YYYY-MM-DD (по умолчанию — сегодня)")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--field", default=None, help="поле строки NDJSON с записью (для журнала — data)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    run_date = datetime.date.fromisoformat(args.run_date) if args.run_date else None
+    export_prices(load_records(args.src, args.field), args.out, run_date, args.format)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from price_dataset import load_records, normalize_prices, read_city_codes
+
+#########################################
+# 1. ИСТОРИЯ ЦЕН В SQLITE (WAL)            #
+#########################################
+class PriceHistory:
+    """
+    История цен всех прогонов в одном файле SQLite (режим WAL: чтение
+    не блокирует запись очередного прогона). Схема нормализована:
+      products, cities, grades (поликарбонат + толщина) — справочники;
+      prices — цена товара в городе для поликарбоната и длины: с observed_at
+               (впервые замечена) по last_seen (последний прогон с той же ценой).
+               Ночной прогон с неизменной ценой только сдвигает last_seen,
+               новая строка появляется лишь при изменении цены;
+      latest — текущая строка по каждому ключу, чтобы «последние цены» не искать по истории.
+    Ключ prices начинается с (товар, город) (WITHOUT ROWID) — ряд цен товара
+    читается по префиксу ключа; индекс (product_id, observed_at) — ряд по времени.
+    """
+
+    def __init__(self, path="price_history.sqlite"):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS cities (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                code TEXT
+            );
+            CREATE TABLE IF NOT EXISTS grades (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                thickness_mm REAL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS grades_key ON grades (name, IFNULL(thickness_mm, 0));
+            CREATE TABLE IF NOT EXISTS prices (
+                product_id INTEGER NOT NULL REFERENCES products (id),
+                city_id INTEGER NOT NULL REFERENCES cities (id),
+                grade_id INTEGER NOT NULL REFERENCES grades (id),
+                length_m REAL NOT NULL,
+                observed_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                price INTEGER NOT NULL,
+                PRIMARY KEY (product_id, city_id, grade_id, length_m, observed_at)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS prices_product_time ON prices (product_id, observed_at);
+            CREATE TABLE IF NOT EXISTS latest (
+                product_id INTEGER NOT NULL,
+                city_id INTEGER NOT NULL,
+                grade_id INTEGER NOT NULL,
+                length_m REAL NOT NULL,
+                observed_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                price INTEGER NOT NULL,
+                PRIMARY KEY (product_id, city_id, grade_id, length_m)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.conn.commit()
+        self.ids = {"products": {}, "cities": {}, "grades": {}}
+
+    def dimension_id(self, table, key, insert_sql, select_sql, params):
+        """id строки справочника (создаётся при первой встрече); вызывать под self.lock."""
+        cache = self.ids[table]
+        if key not in cache:
+            self.conn.execute(insert_sql, params)
+            cache[key] = self.conn.execute(select_sql, params[:2] if table == "grades" else params[:1]).fetchone()[0]
+        return cache[key]
+
+    def product_id(self, name):
+        return self.dimension_id(
+            "products", name,
+            "INSERT OR IGNORE INTO products (name) VALUES (?)",
+            "SELECT id FROM products WHERE name = ?", (name,),
+        )
+
+    def city_id(self, name, code=None):
+        return self.dimension_id(
+            "cities", name,
+            "INSERT OR IGNORE INTO cities (name, code) VALUES (?, ?)",
+            "SELECT id FROM cities WHERE name = ?", (name, code),
+        )
+
+    def grade_id(self, name, thickness_mm):
+        return self.dimension_id(
+            "grades", (name, thickness_mm),
+            "INSERT OR IGNORE INTO grades (name, thickness_mm) VALUES (?, ?)",
+            "SELECT id FROM grades WHERE name = ? AND thickness_mm IS ?", (name, thickness_mm),
+        )
+
+    def record(self, records, observed_at=None, csv_file="teplicy_links_final.csv"):
+        """
+        Записывает цены прогона (записи парсера) одной транзакцией.
+        observed_at — время прогона (unix-время), по умолчанию сейчас; прогоны
+        записываются по порядку: цены старше уже записанных пропускаются.
+        Возвращает число цен прогона.
+        """
+        observed_at = time.time() if observed_at is None else observed_at
+        rows, unparsed = normalize_prices(records, read_city_codes(csv_file))
+        for label, count in sorted(unparsed.items()):
+            logging.warning(f"История цен: ключ не разобран ({count} раз): {label}")
+
+        with self.lock:
+            current = {
+                tuple(row[:4]): tuple(row[4:])
+                for row in self.conn.execute(
+                    "SELECT product_id, city_id, grade_id, length_m, observed_at, last_seen, price FROM latest"
+                )
+            }
+            seen, changed, stale = [], [], 0
+            for row in rows:
+                key = (
+                    self.product_id(row["product"]),
+                    self.city_id(row["city"], row["city_code"]),
+                    self.grade_id(row["grade"], row["thickness_mm"]),
+                    row["length_m"],
+                )
+                known = current.get(key)
+                if known is not None and observed_at < known[1]:
+                    stale += 1
+                    continue
+                if known is not None and known[2] == row["price"]:
+                    seen.append((observed_at, *key, known[0]))
+                    current[key] = (known[0], observed_at, known[2])
+                else:
+                    changed.append((*key, observed_at, observed_at, row["price"]))
+                    current[key] = (observed_at, observed_at, row["price"])
+            key_sql = "product_id = ? AND city_id = ? AND grade_id = ? AND length_m = ?"
+            self.conn.executemany(f"UPDATE prices SET last_seen = ? WHERE {key_sql} AND observed_at = ?", seen)
+            self.conn.executemany(f"UPDATE latest SET last_seen = ? WHERE {key_sql}", [item[:5] for item in seen])
+            self.conn.executemany("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+            self.conn.executemany("INSERT OR REPLACE INTO latest VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+            self.conn.commit()
+        if stale:
+            logging.warning(f"История цен: пропущено {stale} цен старше уже записанных.")
+        logging.info(
+            f"История цен: {len(rows) - stale} цен в '{self.path}', изменилось или появилось {len(changed)}."
+        )
+        return len(rows) - stale
+
+    def lookup_id(self, table, name):
+        row = self.conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    #########################################
+    # 2. ЗАПРОСЫ                               #
+    #########################################
+    def latest(self, product, city):
+        """Текущие цены товара в городе: [{grade, thickness_mm, length_m, price, observed_at, last_seen}, ...]."""
+        with self.lock:
+            product_id, city_id = self.lookup_id("products", product), self.lookup_id("cities", city)
+            rows = self.conn.execute(
+                """
+                SELECT g.name AS grade, g.thickness_mm, l.length_m, l.price, l.observed_at, l.last_seen
+                FROM latest l JOIN grades g ON g.id = l.grade_id
+                WHERE l.product_id = ? AND l.city_id = ?
+                ORDER BY g.name, g.thickness_mm, l.length_m
+                """,
+                (product_id, city_id),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def series(self, product, city=None, since=None):
+        """
+        Ряд цен товара (во всех городах или в одном): по строке на каждое
+        изменение цены, с observed_at по last_seen. since — unix-время.
+        """
+        sql = """
+            SELECT pr.observed_at, pr.last_seen, c.name AS city, g.name AS grade, g.thickness_mm,
+                   pr.length_m, pr.price
+            FROM prices pr
+            JOIN cities c ON c.id = pr.city_id
+            JOIN grades g ON g.id = pr.grade_id
+            WHERE pr.product_id = ? AND pr.last_seen >= ?
+        """
+        with self.lock:
+            params = [self.lookup_id("products", product), since or 0]
+            if city is not None:
+                sql += " AND pr.city_id = ?"
+                params.append(self.lookup_id("cities", city))
+            sql += " ORDER BY pr.observed_at, c.name, g.name, g.thickness_mm, pr.length_m"
+            rows = self.conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+#########################################
+# 3. КОМАНДНАЯ СТРОКА                      #
+#########################################
+def print_rows(rows):
+    for row in rows:
+        row = dict(row)
+        for field in ("observed_at", "last_seen"):
+            row[field] = datetime.datetime.fromtimestamp(row[field]).isoformat(timespec="seconds")
+        print(json.dumps(row, ensure_ascii=False))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="История цен в SQLite: запись прогонов и запросы.")
+    parser.add_argument("--db", default="price_history.sqlite", help="файл истории")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("import", help="записать результаты прогона (прогоны — по порядку дат)")
+    add.add_argument("src", help="итоговый JSON, NDJSON или журнал прогресса")
+    add.add_argument("--field", default=None, help="поле строки NDJSON с записью (для журнала — data)")
+    add.add_argument("--observed-at", default=None,
+                     help="время прогона ГГГГ-ММ-ДД[THH:MM] (по умолчанию — время изменения файла)")
+
+    latest = commands.add_parser("latest", help="текущие цены товара в городе")
+    latest.add_argument("product")
+    latest.add_argument("city")
+
+    series = commands.add_parser("series", help="ряд цен товара по времени")
+    series.add_argument("product")
+    series.add_argument("--city", default=None)
+    series.add_argument("--since", default=None, help="с даты ГГГГ-ММ-ДД")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    history = PriceHistory(args.db)
+    try:
+        if args.command == "import":
+            if args.observed_at:
+                observed_at = datetime.datetime.fromisoformat(args.observed_at).timestamp()
+            else:
+                observed_at = os.path.getmtime(args.src)
+            history.record(load_records(args.src, args.field), observed_at)
+        elif args.command == "latest":
+            print_rows(history.latest(args.product, args.city))
+        else:
+            since = datetime.datetime.fromisoformat(args.since).timestamp() if args.since else None
+            print_rows(history.series(args.product, args.city, since))
+    finally:
+        history.close()
+
+if __name__ == "__main__":
+    main()
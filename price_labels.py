@@ -0,0 +1,40 @@
+import re
+
+#########################################
+# 1. РАЗБОР КЛЮЧЕЙ И ЗНАЧЕНИЙ «ЦЕН»       #
+#########################################
+# Ключ цены: '<тип> (<data-label>)', см. prices_from_rows в teplitsa_parser.py
+#   'Поликарбонат Стандарт 4мм (4 метра)', 'Без поликарбоната (12 метров)'
+LABEL_RE = re.compile(r"^(?P<type>.+?)\s*\((?P<length>\d+(?:[.,]\d+)?)\s*(?:м|метр\w*)\.?\)$")
+POLY_RE = re.compile(r"^Поликарбонат\s+(?P<grade>.+?)\s+(?P<mm>\d+(?:[.,]\d+)?)\s*мм$", re.IGNORECASE)
+NO_POLY = "Без поликарбоната"
+PRICE_VALUE_RE = re.compile(r"^(\d[\d\s]*)\s*руб")
+
+def to_number(text):
+    value = float(text.replace(",", "."))
+    return int(value) if value.is_integer() else value
+
+def parse_price_label(label):
+    """
+    'Поликарбонат Стандарт 4мм (4 метра)' -> {"grade": "Стандарт", "thickness_mm": 4, "length_m": 4}
+    'Без поликарбоната (6 метров)'       -> {"grade": "Без поликарбоната", "thickness_mm": None, "length_m": 6}
+    Ключ другого вида -> None.
+    """
+    match = LABEL_RE.match(" ".join(label.split()))
+    if not match:
+        return None
+    product_type = match.group("type")
+    length = to_number(match.group("length"))
+    if product_type.lower() == NO_POLY.lower():
+        return {"grade": NO_POLY, "thickness_mm": None, "length_m": length}
+    poly = POLY_RE.match(product_type)
+    if not poly:
+        return None
+    return {"grade": poly.group("grade"), "thickness_mm": to_number(poly.group("mm")), "length_m": length}
+
+def parse_price_value(text):
+    """'16990 руб.' / '16 990 руб.' -> 16990; 'Цена отсутствует' и прочее -> None."""
+    match = PRICE_VALUE_RE.match(" ".join(str(text).split()))
+    if not match:
+        return None
+    return int("".join(match.group(1).split()))
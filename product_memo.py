@@ -0,0 +1,88 @@
+import logging
+import random
+import threading
+from urllib.parse import urlsplit
+
+#########################################
+# 1. ХАРАКТЕРИСТИКИ ОДНОЙ ТЕПЛИЦЫ         #
+#########################################
+class CharacteristicsMemo:
+    """
+    Каркас / Ширина / Высота / Снеговая нагрузка у товара одни и те же во всех
+    32 городах — разбираются один раз на товар (на первой же странице), а на
+    страницах остальных городов берутся из памяти, и там нужна только таблица цен.
+    Товар — путь ссылки (item/.../): у поддоменов и ?city=... он один и тот же.
+
+    sample_rate — доля страниц, на которых характеристики всё равно разбираются
+    и сверяются с запомненными: расхождение пишется в лог, в памяти остаётся
+    свежий вариант.
+    В режиме воркеров-процессов у каждого процесса своя копия.
+    """
+
+    def __init__(self, sample_rate=0.05, seed=None):
+        self.sample_rate = sample_rate
+        self.random = random.Random(seed)
+        self.items = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.checks = 0
+        self.mismatches = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(url):
+        return urlsplit(url).path
+
+    def lookup(self, url):
+        """Запомненные характеристики товара или None — разобрать страницу (первый раз или выборочная сверка)."""
+        key = self.key(url)
+        with self.lock:
+            chars = self.items.get(key)
+            if chars is None:
+                return None
+            if self.random.random() < self.sample_rate:
+                self.checks += 1
+                return None
+            self.hits += 1
+            return dict(chars)
+
+    def remember(self, url, chars, logger):
+        """Результат разбора страницы; если товар уже был — сверка с запомненным."""
+        if not chars:
+            # Блока характеристик нет (страница не догрузилась?) — такое не запоминаем
+            return
+        key = self.key(url)
+        with self.lock:
+            known = self.items.get(key)
+            self.items[key] = dict(chars)
+            if known is None or known == chars:
+                return
+            self.mismatches += 1
+        changed = {
+            name: (known.get(name), chars.get(name))
+            for name in sorted(set(known) | set(chars))
+            if known.get(name) != chars.get(name)
+        }
+        logger.warning(f"Характеристики {key} расходятся с запомненными: {changed}")
+
+    def get(self, url, logger, parse):
+        """Характеристики для страницы url: из памяти или parse() (с запоминанием и сверкой)."""
+        chars = self.lookup(url)
+        if chars is None:
+            chars = parse()
+            self.remember(url, chars, logger)
+        return chars
+
+    def log_summary(self):
+        logging.info(
+            f"Характеристики: товаров {len(self.items)}, из памяти {self.hits} страниц, "
+            f"сверок {self.checks}, расхождений {self.mismatches}."
+        )
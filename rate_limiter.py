@@ -0,0 +1,244 @@
+import asyncio
+import contextlib
+import email.utils
+import logging
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from urllib.parse import urlsplit
+
+#########################################
+# 1. RETRY-AFTER                          #
+#########################################
+def parse_retry_after(value, now=None):
+    """
+    Retry-After -> секунды ожидания: '120' или HTTP-дата
+    ('Wed, 21 Oct 2026 07:28:00 GMT'). Пусто / не разобралось -> None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, when.timestamp() - now)
+
+#########################################
+# 2. КОРЗИНА ТОКЕНОВ ОДНОГО ПОДДОМЕНА      #
+#########################################
+class TokenBucket:
+    """
+    Корзина токенов: rate запросов в секунду, не больше burst подряд.
+    Скорость подстраивается по AIMD: быстрый успешный ответ — +increase
+    запросов/с (до max_rate), 429 / 5xx / таймаут / слишком медленный
+    ответ — скорость × decrease (до min_rate). Retry-After ставит
+    поддомен на паузу целиком.
+    """
+
+    def __init__(self, rate=1.0, burst=1, min_rate=0.2, max_rate=4.0, increase=0.1, decrease=0.5,
+                 slow_latency=5.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_latency = slow_latency
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.backoffs = 0
+
+    def acquire(self):
+        """
+        Токен свободен и паузы нет — забирает его и возвращает 0. Иначе токен
+        не тратится, а возвращается, сколько подождать до следующей попытки:
+        за это время скорость может упасть или начаться пауза по Retry-After.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            wait = self.paused_until - now
+        elif self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        else:
+            wait = (1 - self.tokens) / self.rate
+        self.waited += wait
+        return wait
+
+    def observe(self, latency=None, status=None, error=False, retry_after=None):
+        """Итог запроса: latency (с), HTTP-статус (None — браузер), error — таймаут / сетевая ошибка."""
+        congested = error or status == 429 or (status is not None and status >= 500)
+        if latency is not None and latency > self.slow_latency:
+            congested = True
+        if congested:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.backoffs += 1
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            # Токены, накопленные до паузы, не должны выстрелить сразу после неё
+            self.tokens = min(self.tokens, 0.0)
+        return congested
+
+#########################################
+# 3. ЛИМИТЕР ПО ПОДДОМЕНАМ                #
+#########################################
+class HostRateLimiter:
+    """
+    Своя корзина на каждый поддомен (spb.teplitsa-rus.ru, belgorod... — разные хосты).
+    Заменяет фиксированную паузу random.uniform(1, 2) после каждой страницы:
+    пока сайт отвечает быстро, ждать почти не приходится, а при 429 / 5xx /
+    таймаутах скорость падает сама. wait() — для потоков, wait_async() — для asyncio.
+    Токен поддомена ждёт только один запрос (остальные — в очереди на «воротах»
+    поддомена), и после каждой паузы заново смотрит на скорость и Retry-After,
+    поэтому замедление действует и на уже ожидающие запросы.
+    Для воркеров-процессов лимитер один на всех — см. shared_across_processes.
+    """
+
+    def __init__(self, rate=1.0, burst=1, min_rate=0.2, max_rate=4.0, increase=0.1, decrease=0.5,
+                 slow_latency=5.0):
+        self.settings = {
+            "rate": rate, "burst": burst, "min_rate": min_rate, "max_rate": max_rate,
+            "increase": increase, "decrease": decrease, "slow_latency": slow_latency,
+        }
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.gates = {}
+        self.async_loop = None
+        self.async_gates = {}
+
+    def __getstate__(self):
+        # Блокировки не переносятся, создаются заново
+        state = self.__dict__.copy()
+        for name in ("lock", "gates", "async_loop", "async_gates"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.gates = {}
+        self.async_loop = None
+        self.async_gates = {}
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(**self.settings)
+        return self.buckets[host]
+
+    def acquire(self, url):
+        """0 — токен получен, иначе сколько подождать до следующей попытки."""
+        with self.lock:
+            return self.bucket(url).acquire()
+
+    def gate(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            return self.gates.setdefault(host, threading.Lock())
+
+    def async_gate(self, url):
+        # asyncio.Lock привязан к event loop, а каждый раунд повторов — свой asyncio.run
+        loop = asyncio.get_running_loop()
+        host = urlsplit(url).netloc
+        with self.lock:
+            if self.async_loop is not loop:
+                self.async_loop, self.async_gates = loop, {}
+            return self.async_gates.setdefault(host, asyncio.Lock())
+
+    def wait(self, url):
+        waited = 0.0
+        with self.gate(url):
+            while True:
+                delay = self.acquire(url)
+                if delay <= 0:
+                    return waited
+                time.sleep(delay)
+                waited += delay
+
+    async def wait_async(self, url):
+        waited = 0.0
+        async with self.async_gate(url):
+            while True:
+                delay = self.acquire(url)
+                if delay <= 0:
+                    return waited
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def observe(self, url, latency=None, status=None, error=False, retry_after=None):
+        """retry_after — секунды или сырое значение заголовка Retry-After."""
+        if isinstance(retry_after, str):
+            retry_after = parse_retry_after(retry_after)
+        with self.lock:
+            bucket = self.bucket(url)
+            congested = bucket.observe(latency, status, error, retry_after)
+            rate = bucket.rate
+        if congested:
+            host = urlsplit(url).netloc
+            pause = f", пауза {retry_after:.0f} с (Retry-After)" if retry_after else ""
+            logging.warning(f"{host}: замедляемся до {rate:.2f} запр./с{pause}.")
+
+    def snapshot(self):
+        """Состояние корзин (для переноса между процессами)."""
+        with self.lock:
+            return dict(self.buckets)
+
+    def load(self, buckets):
+        with self.lock:
+            self.buckets = dict(buckets)
+
+    def summary(self):
+        """{поддомен: {"rate", "waited", "backoffs"}} — для лога в конце прогона."""
+        with self.lock:
+            return {
+                host: {"rate": round(b.rate, 2), "waited": round(b.waited, 1), "backoffs": b.backoffs}
+                for host, b in sorted(self.buckets.items())
+            }
+
+    def log_summary(self):
+        stats = self.summary()
+        if not stats:
+            return
+        waited = sum(s["waited"] for s in stats.values())
+        backoffs = sum(s["backoffs"] for s in stats.values())
+        logging.info(f"Лимитер: {len(stats)} поддоменов, ожидание всего {waited:.1f} с, замедлений {backoffs}.")
+        for host, s in stats.items():
+            if s["backoffs"]:
+                logging.info(f"  {host}: {s['rate']} запр./с, ожидание {s['waited']} с, замедлений {s['backoffs']}")
+
+#########################################
+# 4. ОДИН ЛИМИТЕР НА ВСЕ ПРОЦЕССЫ          #
+#########################################
+class LimiterManager(BaseManager):
+    """Процесс-сервер, в котором живёт общий HostRateLimiter воркеров-процессов."""
+
+LimiterManager.register("HostRateLimiter", HostRateLimiter)
+
+@contextlib.contextmanager
+def shared_across_processes(limiter):
+    """
+    Копия limiter в отдельном процессе-сервере; воркеры-процессы получают
+    прокси и делят одну корзину на поддомен (иначе каждый процесс шёл бы
+    со своей скоростью и лимит на поддомен умножался бы на число воркеров).
+    wait() выполняется на сервере (поток на соединение), observe() — тоже.
+    По выходе состояние корзин возвращается в limiter — для сводки прогона.
+    """
+    manager = LimiterManager()
+    manager.start()
+    try:
+        shared = manager.HostRateLimiter(**limiter.settings)
+        shared.load(limiter.snapshot())
+        yield shared
+        limiter.load(shared.snapshot())
+    finally:
+        manager.shutdown()
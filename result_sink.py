@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+#########################################
+# 1. ПОТОКОВАЯ ЗАПИСЬ NDJSON              #
+#########################################
+class NdjsonSink:
+    """
+    Результаты по одной строке JSON на запись, сразу по мере готовности страницы:
+    в памяти ничего не копится, а на диске всё, что уже собрано.
+    flush + fsync — не на каждой строке, а раз в fsync_interval секунд
+    (и при close), чтобы не платить за синхронизацию диска на каждой странице.
+    Если следующей записи долго нет (fallback через Chrome, зависшая страница),
+    несинхронизированные строки сбрасывает таймер — через те же fsync_interval секунд.
+    Запись под блокировкой — годится и для одного драйвера, и для воркеров
+    пула / async-режима, вызывающих write из разных потоков.
+    append=True — дописывать в существующий файл (продолжение прогона).
+    """
+
+    def __init__(self, path, fsync_interval=5.0, append=False):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.count = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.fh = open(path, "a" if append else "w", encoding="utf-8")
+        # Оборванную последнюю строку закрываем, чтобы новая запись не склеилась с ней
+        if append and self.fh.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.fh.write("\n")
+        self.synced_at = time.monotonic()
+        self.dirty = False
+        self.timer = None
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.fh.write(line)
+            self.count += 1
+            self.dirty = True
+            elapsed = time.monotonic() - self.synced_at
+            if elapsed >= self.fsync_interval:
+                self.sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.fsync_interval - elapsed, self.sync_idle)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def sync(self):
+        """flush + fsync; вызывать под self.lock."""
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.synced_at = time.monotonic()
+        self.dirty = False
+
+    def sync_idle(self):
+        """Таймер: строки, записанные после последней синхронизации, — на диск."""
+        with self.lock:
+            self.timer = None
+            if self.dirty and not self.fh.closed:
+                self.sync()
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.fh.closed:
+                self.sync()
+                self.fh.close()
+
+#########################################
+# 2. ЧТЕНИЕ И ПЕРЕВОД В ПРИВЫЧНЫЙ JSON     #
+#########################################
+def iter_ndjson(path):
+    """Записи из NDJSON по одной; битые строки (оборванная запись при падении) пропускаются."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"{path}: битая строка #{line_no}, пропускаем.")
+
+def index_ndjson(path, field):
+    """
+    {значение поля field: смещение строки в файле} без хранения самих записей;
+    у повторяющегося значения — последняя строка, битые строки пропускаются.
+    """
+    offsets = {}
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    offsets[json.loads(line)[field]] = offset
+                except (ValueError, KeyError, TypeError):
+                    pass
+            offset += len(line)
+    return offsets
+
+def iter_ndjson_at(path, offsets):
+    """Записи NDJSON по смещениям строк (из index_ndjson) в заданном порядке."""
+    with open(path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+def write_json_array(records, dst):
+    """
+    Пишет записи одним JSON-массивом с indent=4 — байт в байт как
+    json.dump(list(records), f, ensure_ascii=False, indent=4), но по одной
+    записи, не собирая список в памяти. Возвращает число записей.
+    """
+    count = 0
+    tmp = f"{dst}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for record in records:
+            out.write("[\n" if count == 0 else ",\n")
+            text = json.dumps(record, ensure_ascii=False, indent=4)
+            out.write("\n".join("    " + line for line in text.split("\n")))
+            count += 1
+        out.write("\n]" if count else "[]")
+    os.replace(tmp, dst)
+    return count
+
+def ndjson_to_json(src, dst, field=None):
+    """
+    Переводит NDJSON в прежний формат — один JSON-массив с indent=4
+    (write_json_array), построчно, не загружая все записи в память.
+    field — взять из каждой строки это поле (например, "data" у журнала
+    прогресса); пустые значения (None — страница не извлеклась) пропускаются.
+    Возвращает число записанных записей.
+    """
+    records = (entry.get(field) if field else entry for entry in iter_ndjson(src))
+    return write_json_array((record for record in records if record), dst)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NDJSON с результатами -> JSON-массив в прежнем формате.")
+    parser.add_argument("src", help="файл NDJSON (результаты или журнал прогресса)")
+    parser.add_argument("dst", help="итоговый JSON")
+    parser.add_argument("--field", default=None, help="поле строки с записью, для журнала прогресса — data")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    count = ndjson_to_json(args.src, args.dst, args.field)
+    logging.info(f"Записей: {count}, сохранено в '{args.dst}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from checkpoint import journal_key
+from result_sink import iter_ndjson
+
+#########################################
+# 1. ОТЛОЖЕННЫЕ ПОВТОРЫ                    #
+#########################################
+class RetryQueue:
+    """
+    Ссылки, которые не удалось извлечь, не повторяются на месте (и не держат
+    весь обход паузами), а откладываются и обходятся заново после основного
+    прохода — раундами с экспоненциальной паузой base_delay × 2^(раунд-1).
+    Что не удалось и после rounds раундов, уходит в dead-letter файл (NDJSON),
+    который потом можно обойти отдельно (--retry-failed).
+    Страницы 404 — не ошибка: они не повторяются.
+    """
+
+    def __init__(self, rounds=3, base_delay=10):
+        self.rounds = rounds
+        self.base_delay = base_delay
+        self.lock = threading.Lock()
+        self.deferred = []
+        self.attempts = {}
+        self.reasons = {}
+
+    def defer(self, link_info, reason="failed"):
+        key = journal_key(link_info)
+        with self.lock:
+            self.deferred.append(link_info)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            self.reasons[key] = reason
+
+    def wrap(self, on_result, is_failed):
+        """
+        on_result для обхода: неудачи (data пусто и is_failed(link_info))
+        откладываются, всё остальное (данные, 404) сразу уходит в on_result.
+        """
+        def handle(link_info, data):
+            if not data and is_failed(link_info):
+                self.defer(link_info)
+            else:
+                on_result(link_info, data)
+        return handle
+
+    def take(self):
+        with self.lock:
+            links, self.deferred = self.deferred, []
+        return links
+
+    def run(self, crawl, on_result, is_failed):
+        """
+        Раунды повторов: crawl(links, on_result) — тот же обход, что и в основном
+        проходе. Возвращает ссылки, которые так и не удалось извлечь.
+        """
+        for round_no in range(1, self.rounds + 1):
+            links = self.take()
+            if not links:
+                return []
+            delay = self.base_delay * 2 ** (round_no - 1)
+            logging.info(f"Повторы, раунд {round_no}/{self.rounds}: {len(links)} ссылок через {delay:.0f} с.")
+            time.sleep(delay)
+            crawl(links, self.wrap(on_result, is_failed))
+        failed = self.take()
+        if failed:
+            logging.warning(f"Не удалось извлечь после {self.rounds} раундов повторов: {len(failed)} ссылок.")
+        return failed
+
+#########################################
+# 2. DEAD-LETTER ФАЙЛ                      #
+#########################################
+def write_dead_letter(path, links, attempts=None, append=False):
+    """
+    Ссылки, которые не удалось извлечь: по строке JSON на ссылку
+    (поля строки CSV + attempts и failed_at). Файл перезаписывается целиком
+    (append=True — дописывается, для продолжения прогона --resume).
+    """
+    attempts = attempts or {}
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "a" if append else "w", encoding="utf-8") as f:
+        for link_info in links:
+            entry = dict(link_info, attempts=attempts.get(journal_key(link_info), 0), failed_at=time.time())
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    logging.info(f"Dead-letter '{path}': {len(links)} ссылок.")
+
+def read_dead_letter(path):
+    """Ссылки (Название, Город, ГородКод, URL) из dead-letter файла, без повторов."""
+    if not os.path.exists(path):
+        logging.warning(f"Dead-letter файла '{path}' нет, повторять нечего.")
+        return []
+    links = {}
+    for entry in iter_ndjson(path):
+        link_info = {field: entry[field] for field in ("Название", "Город", "ГородКод", "URL")}
+        links[journal_key(link_info)] = link_info
+    return list(links.values())
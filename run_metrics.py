@@ -0,0 +1,211 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 15, 30, 60)
+
+#########################################
+# 1. ЗАМЕРЫ ОДНОЙ СТРАНИЦЫ                #
+#########################################
+class PageTimer:
+    """
+    Время этапов обработки одной ссылки. Этапы с одним именем
+    (например, navigation на каждой попытке) суммируются.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+#########################################
+# 2. МЕТРИКИ ВСЕГО ПРОГОНА                #
+#########################################
+def percentile(sorted_values, q):
+    idx = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def histogram(values):
+    """{"count", "sum", "p50", "p90", "p99", "max", "buckets": {le: накопительное число}}."""
+    values = sorted(values)
+    buckets = {str(le): sum(1 for v in values if v <= le) for le in BUCKETS}
+    buckets["+Inf"] = len(values)
+    return {
+        "count": len(values),
+        "sum": round(sum(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p90": round(percentile(values, 90), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+        "buckets": buckets,
+    }
+
+def prom_labels(**labels):
+    """{key="value",...} с экранированием \\ и " по правилам текстового формата Prometheus."""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+class RunMetrics:
+    """
+    Замеры по каждой ссылке прогона (одна запись на URL): время этапов, число
+    повторных попыток — на месте и в раундах повторов, итог (ok / 404 / failed). В конце — гистограммы по этапам и сводки по городам
+    и поддоменам в JSON и в текстовом формате Prometheus.
+    Записи — обычные dict, их можно передавать между процессами (пул браузеров).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Одна запись на URL: {url: запись последней обработки}
+        self.records = {}
+        self.started_at = time.time()
+
+    def add(self, record):
+        """
+        Вызывать под self.lock. Повторная обработка URL (раунд повторов) заменяет
+        его запись: итог — последний, раунд считается в retries, время прежних
+        попыток прибавляется к total и stages.
+        """
+        known = self.records.pop(record["url"], None)
+        if known is not None:
+            record["retries"] += known["retries"] + 1
+            record["total"] = round(record["total"] + known["total"], 4)
+            stages = dict(known["stages"])
+            for name, seconds in record["stages"].items():
+                stages[name] = round(stages.get(name, 0.0) + seconds, 4)
+            record["stages"] = stages
+        self.records[record["url"]] = record
+
+    def observe(self, url, city, timer, retries=0, status="ok"):
+        record = {
+            "url": url,
+            "host": urlsplit(url).netloc,
+            "city": city,
+            "stages": {name: round(seconds, 4) for name, seconds in timer.stages.items()},
+            "total": round(timer.elapsed(), 4),
+            "retries": retries,
+            "status": status,
+        }
+        with self.lock:
+            self.add(record)
+        return record
+
+    def extend(self, records):
+        with self.lock:
+            for record in records:
+                self.add(record)
+
+    def status(self, url):
+        """Итог последней обработки url (ok / 404 / failed) или None — по нему отложенные повторы отличают сбой от 404."""
+        with self.lock:
+            record = self.records.get(url)
+            return record["status"] if record is not None else None
+
+    def take(self):
+        """Забирает накопленные записи (для пересылки из воркера в главный процесс)."""
+        with self.lock:
+            records, self.records = list(self.records.values()), {}
+        return records
+
+    def group_summary(self, field):
+        groups = defaultdict(list)
+        for record in self.records.values():
+            groups[record[field]].append(record)
+        summary = {}
+        for key, records in groups.items():
+            stages = defaultdict(float)
+            for record in records:
+                for name, seconds in record["stages"].items():
+                    stages[name] += seconds
+            summary[key] = {
+                "urls": len(records),
+                "ok": sum(1 for r in records if r["status"] == "ok"),
+                "not_found": sum(1 for r in records if r["status"] == "404"),
+                "failed": sum(1 for r in records if r["status"] == "failed"),
+                "retries": sum(r["retries"] for r in records),
+                "total_seconds": round(sum(r["total"] for r in records), 3),
+                "stage_seconds": {name: round(seconds, 3) for name, seconds in stages.items()},
+            }
+        return summary
+
+    def summary(self):
+        with self.lock:
+            stage_values = defaultdict(list)
+            for record in self.records.values():
+                for name, seconds in record["stages"].items():
+                    stage_values[name].append(seconds)
+            return {
+                "started_at": self.started_at,
+                "finished_at": time.time(),
+                "urls": len(self.records),
+                "page_seconds": histogram([r["total"] for r in self.records.values()]) if self.records else None,
+                "stages": {name: histogram(values) for name, values in stage_values.items()},
+                "by_city": self.group_summary("city"),
+                "by_host": self.group_summary("host"),
+            }
+
+    def prometheus_text(self):
+        summary = self.summary()
+        lines = [
+            "# HELP teplitsa_stage_seconds Время этапа обработки страницы товара.",
+            "# TYPE teplitsa_stage_seconds histogram",
+        ]
+        for name, hist in summary["stages"].items():
+            for le, count in hist["buckets"].items():
+                lines.append(f"teplitsa_stage_seconds_bucket{prom_labels(stage=name, le=le)} {count}")
+            lines.append(f"teplitsa_stage_seconds_sum{prom_labels(stage=name)} {hist['sum']}")
+            lines.append(f"teplitsa_stage_seconds_count{prom_labels(stage=name)} {hist['count']}")
+
+        lines += [
+            "# HELP teplitsa_pages_total Обработано ссылок по городу, поддомену и итогу.",
+            "# TYPE teplitsa_pages_total counter",
+        ]
+        counts = defaultdict(int)
+        retries = defaultdict(int)
+        seconds = defaultdict(float)
+        with self.lock:
+            for record in self.records.values():
+                counts[(record["city"], record["host"], record["status"])] += 1
+                retries[(record["city"], record["host"])] += record["retries"]
+                seconds[(record["city"], record["host"])] += record["total"]
+        for (city, host, status), count in counts.items():
+            lines.append(f"teplitsa_pages_total{prom_labels(city=city, host=host, status=status)} {count}")
+
+        lines += [
+            "# HELP teplitsa_retries_total Повторные попытки по городу и поддомену.",
+            "# TYPE teplitsa_retries_total counter",
+        ]
+        for (city, host), count in retries.items():
+            lines.append(f"teplitsa_retries_total{prom_labels(city=city, host=host)} {count}")
+
+        lines += [
+            "# HELP teplitsa_page_seconds_total Суммарное время обработки страниц по городу и поддомену.",
+            "# TYPE teplitsa_page_seconds_total counter",
+        ]
+        for (city, host), total in seconds.items():
+            lines.append(f"teplitsa_page_seconds_total{prom_labels(city=city, host=host)} {round(total, 3)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path, prom_path=None):
+        """Сохраняет сводку в JSON и (если указан prom_path) в формате Prometheus."""
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=4)
+        if prom_path:
+            with open(prom_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
@@ -1,4 +1,3 @@
-import json
 import time
 import random
 import logging
@@ -11,6 +10,7 @@ from selenium.common.exceptions import NoSuchElementException, TimeoutException,
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
+from result_sink import NdjsonSink, ndjson_to_json
 
 # Настройка логирования для каждого города
 def setup_logging(city_name):
@@ -302,7 +302,10 @@ def main():
 
     all_links = read_links_from_csv(csv_file, logging)
 
-    all_data = []
+    # Результаты сразу пишем построчно (NDJSON), в памяти не копим
+    output_file = "teplicy_all_cities_data.json"
+    stream_file = f"{output_file}l"
+    sink = NdjsonSink(stream_file)
 
     for entry in all_links:
         name = entry['Название']
@@ -316,7 +319,7 @@ def main():
         data = extract_teplitsa_data(driver, url, logger)
         if data:
             data["Город"] = city
-            all_data.append(data)
+            sink.write(data)
             logger.info(f"Данные для {name} в городе {city} успешно извлечены.")
         else:
             logger.warning(f"Данные для {name} в городе {city} не получены.")
@@ -328,11 +331,10 @@ def main():
     logging.info("WebDriver закрыт.")
     print("\nWebDriver закрыт.")
 
-    # Сохранение всех данных в один JSON-файл
-    output_file = "teplicy_all_cities_data.json"
+    # Сохранение всех данных в один JSON-файл (из NDJSON, в прежнем формате)
+    sink.close()
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
+        ndjson_to_json(stream_file, output_file)
         logging.info(f"Сбор данных завершен. Результат сохранен в '{output_file}'.")
         print(f"Сбор данных завершен. Результат сохранен в '{output_file}'.")
     except Exception as e:
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import logging
+from collections import Counter
+
+from price_dataset import load_records
+from price_labels import parse_price_value
+from result_sink import write_json_array
+
+#########################################
+# 1. ДЕЛЕНИЕ ССЫЛОК НА ШАРДЫ               #
+#########################################
+def parse_shard(text):
+    """'2/4' -> (2, 4): шард с номером 0..N-1 из N."""
+    try:
+        index, total = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ожидается --shard i/N, получено: {text}")
+    if total < 1 or not 0 <= index < total:
+        raise argparse.ArgumentTypeError(f"Номер шарда должен быть от 0 до {total - 1}: {text}")
+    return index, total
+
+def product_shard(link_info, total):
+    """Стабильный хэш (не hash(): он меняется между запусками Python) пары (теплица, город)."""
+    key = f"{link_info['Название']}|{link_info['ГородКод']}".encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big") % total
+
+def select_shard(links, shard, by="city"):
+    """
+    Ссылки шарда shard=(i, N). Разбиение детерминированное — одинаковое
+    на всех раннерах матрицы:
+      by="city"    — города (ГородКод по алфавиту) по кругу: каждый поддомен
+                     обходит ровно один раннер, нагрузка на хост не растёт;
+      by="product" — хэш пары (теплица, город): шарды ровнее по размеру.
+    """
+    index, total = shard
+    if by == "city":
+        codes = sorted({link_info["ГородКод"] for link_info in links})
+        mine = {code for pos, code in enumerate(codes) if pos % total == index}
+        selected = [link_info for link_info in links if link_info["ГородКод"] in mine]
+    else:
+        selected = [link_info for link_info in links if product_shard(link_info, total) == index]
+    logging.info(f"Шард {index}/{total} (по {by}): {len(selected)} из {len(links)} ссылок.")
+    return selected
+
+def shard_suffix(shard):
+    """Суффикс файлов шарда, чтобы шарды в одной папке не затирали друг друга."""
+    return f"_shard{shard[0]}of{shard[1]}" if shard else ""
+
+#########################################
+# 2. СЛИЯНИЕ И ПРОВЕРКА РЕЗУЛЬТАТОВ        #
+#########################################
+# Цены, которых нет: явная надпись или пустая ячейка poly-price (parser.prices_from_table)
+NO_PRICE = ("Цена отсутствует", "", None)
+
+def validate_record(record):
+    """Список проблем записи (пустой — запись годится для загрузки)."""
+    problems = []
+    if not record.get("Название") or record.get("Название") == "Не указано":
+        problems.append("нет названия")
+    if not record.get("Город"):
+        problems.append("нет города")
+    prices = record.get("Цены")
+    if not isinstance(prices, dict):
+        problems.append("нет словаря «Цены»")
+    else:
+        for label, value in prices.items():
+            if value not in NO_PRICE and parse_price_value(value) is None:
+                problems.append(f"цена не разбирается: {label} = {value}")
+    return problems
+
+def merge_shards(paths, field=None):
+    """
+    Объединяет результаты шардов (JSON, NDJSON или журналы с field="data").
+    Дубликаты по (Название, Город) схлопываются — остаётся запись с большим
+    числом цен (при равенстве — более поздняя). Записи с проблемами
+    отбрасываются и возвращаются отдельно.
+    Возвращает (records, invalid [(запись, проблемы)], число дубликатов).
+    """
+    merged = {}
+    invalid = []
+    duplicates = 0
+    for path in paths:
+        count = 0
+        for record in load_records(path, field):
+            count += 1
+            problems = validate_record(record)
+            if problems:
+                invalid.append((record, problems))
+                continue
+            key = (record["Название"], record["Город"])
+            if key in merged:
+                duplicates += 1
+                if len(record["Цены"]) < len(merged[key]["Цены"]):
+                    continue
+            merged[key] = record
+        logging.info(f"Шард '{path}': {count} записей.")
+    return list(merged.values()), invalid, duplicates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Слияние и проверка результатов шардов перед загрузкой.")
+    parser.add_argument("paths", nargs="+", help="результаты шардов (JSON / NDJSON / журналы)")
+    parser.add_argument("-o", "--output", required=True, help="итоговый JSON")
+    parser.add_argument("--field", default=None, help="поле строки NDJSON с записью (для журнала — data)")
+    parser.add_argument("--expect-cities", type=int, default=None,
+                        help="сколько городов должно быть в итоге (например, 32); иначе код выхода 1")
+    parser.add_argument("--strict", action="store_true",
+                        help="код выхода 1 и при любой отброшенной записи")
+    parser.add_argument("--max-invalid-share", type=float, default=None,
+                        help="код выхода 1, если отброшено больше этой доли записей (например, 0.02): "
+                             "так смена вёрстки не урежет загрузку незаметно")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    records, invalid, duplicates = merge_shards(args.paths, args.field)
+    for record, problems in invalid[:50]:
+        logging.warning(f"Отброшено: {record.get('Название')} / {record.get('Город')}: {'; '.join(problems)}")
+    # Сводка по причинам: «цена не разбирается: <ключ> = <значение>» -> «цена не разбирается»
+    reasons = Counter(problem.split(":")[0] for _record, problems in invalid for problem in problems)
+    for reason, count in reasons.most_common():
+        logging.warning(f"Отброшено по причине «{reason}»: {count}")
+    by_city = Counter(record["Город"] for record in records)
+    logging.info(
+        f"Итого: {len(records)} записей, {len(by_city)} городов, дубликатов {duplicates}, отброшено {len(invalid)}."
+    )
+
+    write_json_array(records, args.output)
+    logging.info(f"Сохранено в '{args.output}'")
+
+    # Не хватает городов — какой-то шард упал или вернул пустоту: загружать нельзя
+    if args.expect_cities is not None and len(by_city) != args.expect_cities:
+        logging.error(f"Городов {len(by_city)}, ожидалось {args.expect_cities}.")
+        raise SystemExit(1)
+    if args.strict and invalid:
+        raise SystemExit(1)
+    total = len(records) + duplicates + len(invalid)
+    if args.max_invalid_share is not None and total and len(invalid) / total > args.max_invalid_share:
+        logging.error(f"Отброшено {len(invalid)} из {total} записей — больше {args.max_invalid_share:.0%}.")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
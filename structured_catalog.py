@@ -0,0 +1,169 @@
+import argparse
+import logging
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from price_labels import parse_price_label, parse_price_value, to_number
+from price_dataset import load_records
+from result_sink import write_json_array
+
+# Форма теплицы по модели в названии (h1). Для навесов, грядок и т.п. формы нет.
+FORM_RE = re.compile(
+    r"\b(?P<model>БОЯРСКАЯ|ДОМИК|СТРЕЛЕЦКАЯ|ЦАРСКАЯ|ПРИСТЕННАЯ|МИТЛАЙДЕР|МОНАРХ|ПРЕМЬЕР)\b"
+)
+FORMS = {
+    "БОЯРСКАЯ": "Арочная",
+    "ДОМИК": "Домиком",
+    "СТРЕЛЕЦКАЯ": "Каплевидная",
+    "ЦАРСКАЯ": "Прямостенная",
+    "ПРИСТЕННАЯ": "Пристенная",
+    "МИТЛАЙДЕР": "Митлайдер",
+    "МОНАРХ": "Промышленная",
+    "ПРЕМЬЕР": "Промышленная",
+}
+WIDTH_RE = re.compile(r"^(?P<value>\d+(?:[.,]\d+)?)\s*(?:м|метр\w*)\.?$")
+
+#########################################
+# 1. ОДНА ЗАПИСЬ -> СТРУКТУРИРОВАННАЯ     #
+#########################################
+def convert_record(record):
+    """
+    Сырая запись парсера -> схема teplicy_msk_stavropol_data.json / greenhouses.py:
+      Название, Форма, Каркас [..], Ширина (число), Длина [..], Поликарбонат [..],
+      Цена {"Стандарт_4мм_4": 16990, ..., "Без поликарбоната_4": 12990}, Город.
+    «Шаг дуг» парсер не собирает — в выходе его нет.
+    Возвращает (запись, [неразобранные ключи / значения]).
+    """
+    problems = []
+    name = record.get("Название")
+    out = {"Название": name}
+
+    form = FORM_RE.search(name or "")
+    if form:
+        out["Форма"] = FORMS[form.group("model")]
+
+    frame = record.get("Каркас")
+    if frame:
+        out["Каркас"] = [" ".join(frame.split())]
+
+    width = record.get("Ширина")
+    if width:
+        match = WIDTH_RE.match(" ".join(width.split()))
+        if match:
+            out["Ширина"] = to_number(match.group("value"))
+        else:
+            problems.append(f"Ширина: {width}")
+
+    lengths = []
+    grades = []
+    prices = {}
+    for label, value in (record.get("Цены") or {}).items():
+        parsed = parse_price_label(label)
+        if parsed is None:
+            problems.append(label)
+            continue
+        grade, length = parsed["grade"], parsed["length_m"]
+        if parsed["thickness_mm"] is None:
+            key = f"{grade}_{length}"
+        else:
+            key = f"{grade}_{parsed['thickness_mm']}мм_{length}"
+            if grade not in grades:
+                grades.append(grade)
+
+        price = parse_price_value(value)
+        if price is None:
+            # «Цена отсутствует» — цены нет, но это не ошибка разбора
+            if value != "Цена отсутствует":
+                problems.append(f"{label} = {value}")
+            continue
+        prices[key] = price
+        if length not in lengths:
+            lengths.append(length)
+
+    if lengths:
+        out["Длина"] = sorted(lengths)
+    if grades:
+        out["Поликарбонат"] = grades
+    out["Цена"] = prices
+    out["Город"] = record.get("Город")
+    return out, problems
+
+def convert_batch(batch):
+    """Пачка записей -> (структурированные записи, Counter неразобранного). Выполняется в воркере."""
+    converted = []
+    problems = Counter()
+    for record in batch:
+        out, bad = convert_record(record)
+        converted.append(out)
+        for item in bad:
+            problems[(item, record.get("Название"), record.get("Город"))] += 1
+    return converted, problems
+
+def batches(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+#########################################
+# 2. ПОТОК ЗАПИСЕЙ -> ФАЙЛ                 #
+#########################################
+def convert_stream(records, dst, batch_size=500, workers=1):
+    """
+    Конвертирует поток записей пачками (workers > 1 — в нескольких процессах,
+    порядок сохраняется) и пишет результат в dst построчно.
+    Возвращает (число записей, Counter {(ключ, название, город): сколько}).
+    """
+    problems = Counter()
+
+    def converted(results):
+        for batch_out, batch_problems in results:
+            problems.update(batch_problems)
+            yield from batch_out
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            count = write_json_array(converted(pool.map(convert_batch, batches(records, batch_size))), dst)
+    else:
+        count = write_json_array(converted(map(convert_batch, batches(records, batch_size))), dst)
+    return count, problems
+
+def report_problems(problems, limit=50):
+    """Неразобранные ключи / значения — в лог, по убыванию частоты."""
+    if not problems:
+        logging.info("Все ключи цен разобраны.")
+        return
+    by_label = Counter()
+    for (item, _name, _city), count in problems.items():
+        by_label[item] += count
+    logging.warning(f"Не разобрано: {sum(by_label.values())} значений, {len(by_label)} разных.")
+    for item, count in by_label.most_common(limit):
+        examples = [f"{name} / {city}" for (it, name, city) in problems if it == item][:3]
+        logging.warning(f"  {count:>5} × {item}  (например: {'; '.join(examples)})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Результаты парсера (все города) -> структурированный каталог "
+                    "(Ширина числом, Длина, Поликарбонат, Цена {'Стандарт_4мм_4': ...})."
+    )
+    parser.add_argument("src", help="итоговый JSON, NDJSON или журнал прогресса (--field data)")
+    parser.add_argument("dst", help="куда записать структурированный JSON")
+    parser.add_argument("--field", default=None, help="поле строки NDJSON с записью (для журнала — data)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1, help="процессов для конвертации")
+    parser.add_argument("--strict", action="store_true", help="код выхода 1, если что-то не разобрано")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    count, problems = convert_stream(load_records(args.src, args.field), args.dst, args.batch_size, args.workers)
+    logging.info(f"Записей: {count}, сохранено в '{args.dst}'")
+    report_problems(problems)
+    if args.strict and problems:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
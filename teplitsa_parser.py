@@ -1,4 +1,3 @@
-import json
 import time
 import random
 import logging
@@ -8,6 +7,7 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import (
+    JavascriptException,
     NoSuchElementException,
     TimeoutException,
     WebDriverException,
@@ -16,6 +16,21 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 import os
+import argparse
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from page_cache import PageCache
+from checkpoint import ProgressJournal, journal_to_json
+from run_metrics import PageTimer, RunMetrics
+from driver_manager import ManagedDriver
+from sharding import parse_shard, select_shard, shard_suffix
+from rate_limiter import HostRateLimiter
+from retry_queue import RetryQueue, read_dead_letter, write_dead_letter
+from product_memo import CharacteristicsMemo
+
+# Быстрый C-парсер для разбора HTML-снимков (pip install lxml)
+HTML_PARSER = "lxml"
 
 ########################
 # 1. ЛОГИРОВАНИЕ ГОРОДА #
@@ -35,7 +50,28 @@ def setup_logging(city_name):
 ###############################
 # 2. НАСТРОЙКА SELENIUM-DRАЙВ #
 ###############################
-def setup_driver(chromedriver_path=None):
+# Лёгкий профиль (--browser-profile lean): что не нужно для чтения текста и таблиц.
+# Стили не блокируются: h1 на сайте набран через text-transform, и .text / innerText
+# без CSS вернули бы название в другом регистре, чем в уже собранных данных.
+BLOCKED_URLS = [
+    # картинки, шрифты, видео
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm",
+    # аналитика и сторонние виджеты
+    "*mc.yandex.ru*", "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*youtube.com*", "*ytimg.com*", "*vk.com*", "*facebook.net*", "*jivosite.com*",
+    # карусель картинок
+    "*/scripts/slick/*",
+]
+
+def setup_driver(chromedriver_path=None, lean=False, blocked_urls=None):
+    """
+    lean=True — лёгкий профиль: страница считается загруженной по DOMContentLoaded
+    (page_load_strategy="eager"), картинки отключены, а URL из BLOCKED_URLS
+    и blocked_urls не загружаются вовсе (CDP Network.setBlockedURLs).
+    Меньше трафика и отрисовки на страницу и меньше памяти у каждого Chrome.
+    """
     chrome_options = Options()
     chrome_options.add_argument("--headless")  # Если хотите видеть окно браузера, закомментируйте
     chrome_options.add_argument("--disable-gpu")
@@ -46,17 +82,38 @@ def setup_driver(chromedriver_path=None):
     chrome_options.add_argument(
         "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)"
     )
+    if lean:
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument("--autoplay-policy=user-gesture-required")
 
     if chromedriver_path:
         driver = webdriver.Chrome(executable_path=chromedriver_path, options=chrome_options)
     else:
         driver = webdriver.Chrome(options=chrome_options)
+
+    if lean:
+        patterns = BLOCKED_URLS + list(blocked_urls or [])
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        except WebDriverException as e:
+            logging.warning(f"Блокировка URL через CDP недоступна: {e}")
     return driver
 
 #################################
 # 3. ПРОВЕРКА, НЕ 404 ЛИ СТРАНИЦА #
 #################################
-def is_page_available(driver, logger):
+def is_page_available(driver, logger, record=None):
+    if record is not None:
+        if record["is404"]:
+            logger.warning("Страница вернула 404 (title / h1).")
+            return False
+        return True
     try:
         if "404" in driver.title.lower():
             logger.warning("Страница вернула 404 (title).")
@@ -100,18 +157,79 @@ def read_links_from_csv(csv_file, logger):
 ################################
 # 5. ИЗВЛЕЧЕНИЕ ХАРАКТЕРИСТИК    #
 ################################
-def extract_characteristics(driver, logger):
-    """Парсит div.prod_desc / div.description, строки вида 'Ключ: значение'."""
+CHARACTERISTIC_KEYS = {
+    "Каркас",
+    "Ширина",
+    "Высота",
+    "Снеговая нагрузка",
+    "Горизонтальные стяжки",
+    "Комплектация"
+}
+
+def parse_characteristics_html(html_desc, logger):
+    """Разбирает innerHTML блока описания на строки 'Ключ: значение'."""
     characteristics = {}
-    valid_keys = {
-        "Каркас",
-        "Ширина",
-        "Высота",
-        "Снеговая нагрузка",
-        "Горизонтальные стяжки",
-        "Комплектация"
-    }
+    valid_keys = CHARACTERISTIC_KEYS
     current_key = None
+
+    soup = BeautifulSoup(html_desc, "html.parser")
+
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+
+    lines = [ln.strip() for ln in soup.get_text(separator="\n").split("\n") if ln.strip()]
+    logger.info("Извлечённые строки характеристик:")
+    for line in lines:
+        logger.info(f"  - {line}")
+
+    for line in lines:
+        line = re.sub(r'^[-\s]+', '', line)
+        match = re.match(r'^(?P<key>[^:]+):\s*(?P<value>.+)$', line)
+        if match:
+            key = match.group("key").strip()
+            val = match.group("value").strip()
+            if key in valid_keys:
+                characteristics[key] = val
+                logger.info(f"Извлечена характеристика: {key} = {val}")
+            else:
+                logger.warning(f"Неизвестный ключ: {key} => {val}, пропускаем.")
+            current_key = None
+        else:
+            # возможно строка начинается с ':'
+            if line.startswith(":"):
+                val = line[1:].strip()
+                if current_key and current_key in valid_keys:
+                    characteristics[current_key] = val
+                    logger.info(f"Извлечена характеристика: {current_key} = {val}")
+                else:
+                    logger.warning(f"Строка без ключа: {val}, пропускаем.")
+            else:
+                if line in valid_keys:
+                    current_key = line
+                    logger.info(f"Найден ключ: {current_key}")
+                else:
+                    logger.warning(f"Строка не соответствует формату: {line}")
+
+    return characteristics
+
+def extract_characteristics(driver, logger, record=None):
+    """
+    Парсит div.prod_desc / div.description, строки вида 'Ключ: значение'.
+    Если передан record (результат EXTRACT_RECORD_JS), берёт HTML блока из него,
+    без обращений к драйверу.
+    """
+    characteristics = {}
+    if record is not None:
+        if record["descHtml"] is None:
+            logger.warning("Не найден блок характеристик (div.prod_desc / div.description).")
+        else:
+            try:
+                characteristics = parse_characteristics_html(record["descHtml"], logger)
+            except Exception as e:
+                logger.error(f"Ошибка при извлечении характеристик: {e}")
+        logger.info(f"Итоговые характеристики: {characteristics}")
+        return characteristics
+
     try:
         try:
             desc_div = driver.find_element(By.CSS_SELECTOR, "div.prod_desc")
@@ -119,43 +237,7 @@ def extract_characteristics(driver, logger):
             desc_div = driver.find_element(By.CSS_SELECTOR, "div.description")
 
         html_desc = desc_div.get_attribute("innerHTML")
-        soup = BeautifulSoup(html_desc, "html.parser")
-
-        for br in soup.find_all("br"):
-            br.replace_with("\n")
-
-        lines = [ln.strip() for ln in soup.get_text(separator="\n").split("\n") if ln.strip()]
-        logger.info("Извлечённые строки характеристик:")
-        for line in lines:
-            logger.info(f"  - {line}")
-
-        for line in lines:
-            line = re.sub(r'^[-\s]+', '', line)
-            match = re.match(r'^(?P<key>[^:]+):\s*(?P<value>.+)$', line)
-            if match:
-                key = match.group("key").strip()
-                val = match.group("value").strip()
-                if key in valid_keys:
-                    characteristics[key] = val
-                    logger.info(f"Извлечена характеристика: {key} = {val}")
-                else:
-                    logger.warning(f"Неизвестный ключ: {key} => {val}, пропускаем.")
-                current_key = None
-            else:
-                # возможно строка начинается с ':'
-                if line.startswith(":"):
-                    val = line[1:].strip()
-                    if current_key and current_key in valid_keys:
-                        characteristics[current_key] = val
-                        logger.info(f"Извлечена характеристика: {current_key} = {val}")
-                    else:
-                        logger.warning(f"Строка без ключа: {val}, пропускаем.")
-                else:
-                    if line in valid_keys:
-                        current_key = line
-                        logger.info(f"Найден ключ: {current_key}")
-                    else:
-                        logger.warning(f"Строка не соответствует формату: {line}")
+        characteristics = parse_characteristics_html(html_desc, logger)
     except NoSuchElementException:
         logger.warning("Не найден блок характеристик (div.prod_desc / div.description).")
     except Exception as e:
@@ -217,76 +299,711 @@ def extract_prices(driver, logger):
 
     return prices
 
+def prices_from_rows(rows, logger):
+    """
+    Общий разбор строк таблицы poly-price: rows — список строк,
+    строка — список ячеек (текст, data-label). Ключи: '<тип> (<data-label>)'.
+    """
+    prices = {}
+    logger.info(f"Найдена таблица poly-price, строк: {len(rows)}")
+    for row_idx, cols in enumerate(rows, start=1):
+        logger.debug(f"Строка {row_idx}, ячеек: {len(cols)}")
+        if len(cols) < 3:
+            continue
+
+        # Первый столбец => тип поликарбоната, напр. "Поликарбонат Стандарт 4мм"
+        product_type = cols[0][0].strip()
+        logger.debug(f"Строка {row_idx}, product_type: {product_type}")
+
+        # Начиная с cols[2..], с data-label="4 метра" и т.д.
+        for c_idx in range(2, len(cols)):
+            price_text, length_label = cols[c_idx]
+            price_text = price_text.strip()
+            length_label = (length_label or "").strip()
+
+            if not length_label:
+                logger.debug(f"Нет data-label в ячейке c_idx={c_idx}, пропускаем.")
+                continue
+
+            key = f"{product_type} ({length_label})"
+            if price_text:
+                prices[key] = price_text
+                logger.info(f"Извлечена цена: {key} = {price_text}")
+            else:
+                prices[key] = "Цена отсутствует"
+                logger.warning(f"Цена для {key} отсутствует.")
+
+    return prices
+
+def extract_prices_snapshot(driver, logger, record=None):
+    """
+    То же, что extract_prices, но без обхода ячеек через WebDriver:
+    outerHTML таблицы забирается одним запросом и разбирается локально
+    (extract_prices_html). Ключи те же: '<тип> (<data-label>)'.
+    Если передан record (результат EXTRACT_RECORD_JS), строки берутся из него.
+    """
+    if record is not None:
+        if record["priceRows"] is None:
+            logger.warning("Таблица .tb2.adaptive.poly-price не найдена (цены не извлечены).")
+            return {}
+        return prices_from_rows(record["priceRows"], logger)
+
+    try:
+        table = driver.find_element(By.CSS_SELECTOR, "table.tb2.adaptive.poly-price")
+        table_html = table.get_attribute("outerHTML")
+    except NoSuchElementException:
+        logger.warning("Таблица .tb2.adaptive.poly-price не найдена (цены не извлечены).")
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при извлечении цен: {e}")
+        return {}
+
+    soup = BeautifulSoup(table_html, HTML_PARSER)
+    return extract_prices_html(soup, logger)
+
+#########################################
+# 6a. ВСЯ ЗАПИСЬ ОДНИМ execute_script     #
+#########################################
+# Возвращает всё, что нужно extract_teplitsa_data, за один round trip:
+#   is404     — признак 404 (title или h1),
+#   title     — текст h1 (innerText, с учётом text-transform, как .text у Selenium),
+#   descHtml  — innerHTML div.prod_desc / div.description,
+#   priceRows — строки poly-price: [[текст, data-label], ...] по каждой td.
+EXTRACT_RECORD_JS = """
+const h1s = Array.from(document.querySelectorAll("h1"));
+const h1 = h1s.length ? h1s[0] : null;
+const desc = document.querySelector("div.prod_desc") || document.querySelector("div.description");
+const table = document.querySelector("table.tb2.adaptive.poly-price");
+// &nbsp; и переносы -> обычный пробел, как в .text у Selenium
+const clean = el => el.innerText.replace(/\s+/g, " ").trim();
+return {
+    is404: (document.title || "").toLowerCase().includes("404")
+        || h1s.some(h => h.textContent.includes("404")),
+    title: h1 ? clean(h1) : null,
+    descHtml: desc ? desc.innerHTML : null,
+    priceRows: table ? Array.from(table.querySelectorAll("tr")).map(
+        tr => Array.from(tr.querySelectorAll("td")).map(
+            td => [clean(td), td.getAttribute("data-label") || ""]
+        )
+    ) : null
+};
+"""
+
+def fetch_record_js(driver, logger):
+    """Выполняет EXTRACT_RECORD_JS; при ошибке скрипта возвращает None."""
+    try:
+        return driver.execute_script(EXTRACT_RECORD_JS)
+    except JavascriptException as e:
+        logger.warning(f"JS-извлечение не удалось ({e}), читаем элементы по одному.")
+        return None
+
+##############################################
+# 6b. ВЫБОР ГОРОДА ЗАРАНЕЕ И ГОТОВНОСТЬ СТРАНИЦЫ #
+##############################################
+CITY_POPUP_BUTTON = ".choose-city-popup .accept-city"
+
+# Страница готова к разбору: есть h1 и описание / таблица цен (или это 404)
+CONTENT_READY_JS = """
+return !!document.querySelector("h1") && (
+    !!document.querySelector("div.prod_desc, div.description, table.tb2.adaptive.poly-price")
+    || (document.title || "").includes("404")
+);
+"""
+
+def close_city_popup(driver, logger, timeout=5):
+    """Ждёт окно выбора города до timeout секунд и подтверждает город. True — окно было закрыто."""
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, CITY_POPUP_BUTTON))
+        )
+        popup_btn = driver.find_element(By.CSS_SELECTOR, CITY_POPUP_BUTTON)
+        popup_btn.click()
+        logger.info("Закрыли всплывающее окно выбора города.")
+        return True
+    except TimeoutException:
+        logger.info("Окно города не появилось.")
+    except NoSuchElementException:
+        logger.info("Кнопка окна выбора города не найдена.")
+    return False
+
+class CityPreset:
+    """
+    Выбор города без окна: cookie / localStorage выставляются до перехода,
+    один раз на поддомен за сессию браузера, дальше ждём только то, что разбираем
+    (h1, описание, poly-price) с частым опросом. Окно города нажимается
+    лишь если страница так и не стала готовой.
+
+    cookies / storage — {имя: значение} для всех поддоменов (--city-cookie,
+    --city-storage). Если окно всё же пришлось нажать, появившиеся после
+    клика cookie запоминаются для этого поддомена и ставятся следующему
+    драйверу (пул, перезапуск) — и пишутся в лог, чтобы их можно было
+    передать явно.
+    """
+
+    def __init__(self, cookies=None, storage=None, timeout=4, poll=0.2):
+        self.cookies = dict(cookies or {})
+        self.storage = dict(storage or {})
+        self.timeout = timeout
+        self.poll = poll
+        self.learned = {}   # host -> {имя cookie: значение}
+        self.hosts = set()  # поддомены, где в текущем драйвере город уже выставлен
+        self.session_id = None
+
+    def fresh(self):
+        """Копия настроек для другого драйвера (воркер пула)."""
+        preset = CityPreset(self.cookies, self.storage, self.timeout, self.poll)
+        preset.learned = {host: dict(cookies) for host, cookies in self.learned.items()}
+        return preset
+
+    def prime(self, driver, url, logger, limiter=None):
+        """
+        Ставит cookie / localStorage поддомена url до перехода на страницу
+        (один раз на поддомен за сессию драйвера). Cookie ставятся только
+        на открытый домен, поэтому поддомен сначала открывается лёгкой
+        страницей /robots.txt — это один лишний запрос на поддомен за сессию.
+        Пока ставить нечего (нет --city-cookie / --city-storage и окно на
+        этом поддомене ещё не нажимали), ничего не делает.
+        """
+        # Новый драйвер (перезапуск, recycle) — cookie и localStorage ставим заново
+        session_id = getattr(driver, "session_id", None)
+        if session_id != self.session_id:
+            self.session_id = session_id
+            self.hosts.clear()
+        parts = urlsplit(url)
+        host = parts.netloc
+        if host in self.hosts:
+            return
+        cookies = {**self.cookies, **self.learned.get(host, {})}
+        if not cookies and not self.storage:
+            return
+        self.hosts.add(host)
+        robots = f"{parts.scheme}://{host}/robots.txt"
+        try:
+            if limiter is not None:
+                limiter.wait(robots)
+            started = time.monotonic()
+            try:
+                driver.get(robots)
+            except TimeoutException:
+                if limiter is not None:
+                    limiter.observe(robots, time.monotonic() - started, error=True)
+                raise
+            if limiter is not None:
+                limiter.observe(robots, time.monotonic() - started)
+            for name, value in cookies.items():
+                driver.add_cookie({"name": name, "value": value, "path": "/"})
+            if self.storage:
+                driver.execute_script(
+                    "for (const [k, v] of Object.entries(arguments[0])) localStorage.setItem(k, v);",
+                    self.storage,
+                )
+            logger.info(f"Город для {host} выставлен заранее (cookie: {len(cookies)}, localStorage: {len(self.storage)}).")
+        except WebDriverException as e:
+            logger.warning(f"Не удалось выставить город для {host}: {e}")
+
+    def wait_for_content(self, driver, url, logger):
+        """
+        Ждёт готовности страницы до timeout секунд с опросом каждые poll секунд.
+        Не дождались — пробуем закрыть окно города и ждём ещё раз.
+        """
+        wait = WebDriverWait(driver, self.timeout, poll_frequency=self.poll)
+        try:
+            wait.until(lambda d: d.execute_script(CONTENT_READY_JS))
+            return
+        except TimeoutException:
+            logger.info("Страница не готова, проверяем окно выбора города.")
+
+        before = {c["name"]: c["value"] for c in driver.get_cookies()}
+        if not close_city_popup(driver, logger, timeout=1):
+            return
+        after = {c["name"]: c["value"] for c in driver.get_cookies()}
+        changed = {name: value for name, value in after.items() if before.get(name) != value}
+        if changed:
+            host = urlsplit(url).netloc
+            self.learned.setdefault(host, {}).update(changed)
+            # Cookie уже стоят в этом драйвере — открывать поддомен заранее не нужно
+            self.hosts.add(host)
+            logger.info(f"Выбор города для {host} хранится в cookie: {', '.join(changed)}")
+        try:
+            wait.until(lambda d: d.execute_script(CONTENT_READY_JS))
+        except TimeoutException:
+            logger.warning("Страница так и не стала готовой, разбираем то, что есть.")
+
 ################################
 # 7. ИЗВЛЕЧЕНИЕ ДАННЫХ С ОДНОЙ ТЕПЛИЦЫ
 ################################
-def extract_teplitsa_data(driver, url, logger, retries=3):
+def extract_teplitsa_data(driver, url, logger, retries=1, metrics=None, timer=None, city=None, limiter=None,
+                          memo=None):
+    """
+    retries — попыток подряд, без пауз между ними. По умолчанию одна: неудачная
+    страница не держит обход, а откладывается в очередь повторов (retry_queue.RetryQueue).
+    metrics — RunMetrics: время этапов (навигация, ожидание body, окно города,
+    разбор характеристик и цен) и число повторных попыток для сводки прогона.
+    timer — PageTimer, если замер страницы уже начат (HTTP-путь перед fallback).
+    city — CityPreset: вместо ожидания окна города (до 5 с на каждой странице)
+    город выставляется заранее, а ждём только h1 / описание / таблицу цен.
+    driver — WebDriver или ManagedDriver. С ManagedDriver упавший Chrome
+    перезапускается так, что новый драйвер получают и все следующие вызовы,
+    а после страницы проверяются лимиты страниц и памяти.
+    limiter — HostRateLimiter: перед загрузкой ждём токен поддомена,
+    время навигации и таймауты подстраивают его скорость.
+    memo — CharacteristicsMemo: характеристики товара разбираются один раз
+    на все города, на остальных страницах — только цены.
+    """
     data = {}
     attempt = 0
+    timer = timer or PageTimer()
+    browser = driver if isinstance(driver, ManagedDriver) else None
+
+    def finish(result, status):
+        if metrics is not None:
+            # Логгер города называется именем города (setup_logging)
+            metrics.observe(url, logger.name, timer, retries=attempt, status=status)
+        if browser is not None:
+            browser.page_done()
+        return result
+
     while attempt < retries:
         try:
+            if browser is not None:
+                driver = browser.driver
             logger.info(f"\nПереходим по ссылке: {url}")
-            driver.get(url)
-
-            WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
+            if city is not None:
+                with timer.stage("city_preset"):
+                    city.prime(driver, url, logger, limiter=limiter)
+            if limiter is not None:
+                limiter.wait(url)
+            started = time.monotonic()
+            with timer.stage("navigation"):
+                try:
+                    driver.get(url)
+                except TimeoutException:
+                    if limiter is not None:
+                        limiter.observe(url, time.monotonic() - started, error=True)
+                    raise
+            if limiter is not None:
+                limiter.observe(url, time.monotonic() - started)
 
-            # Закрываем всплывающее окно (если есть)
-            try:
-                WebDriverWait(driver, 5).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, ".choose-city-popup .accept-city"))
+            with timer.stage("body_wait"):
+                WebDriverWait(driver, 15).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "body"))
                 )
-                popup_btn = driver.find_element(By.CSS_SELECTOR, ".choose-city-popup .accept-city")
-                popup_btn.click()
-                logger.info("Закрыли всплывающее окно выбора города.")
-            except TimeoutException:
-                logger.info("Окно города не появилось.")
-            except NoSuchElementException:
-                logger.info("Кнопка окна выбора города не найдена.")
+
+            if city is None:
+                # Закрываем всплывающее окно (если есть)
+                with timer.stage("popup_wait"):
+                    close_city_popup(driver, logger)
+            else:
+                # Город выставлен заранее — ждём только нужные элементы
+                with timer.stage("content_wait"):
+                    city.wait_for_content(driver, url, logger)
+
+            # Заголовок, описание и таблица цен — одним execute_script;
+            # если скрипт не отработал, record=None и всё читается по элементам
+            with timer.stage("record_js"):
+                record = fetch_record_js(driver, logger)
 
             # Проверка 404
-            if not is_page_available(driver, logger):
+            if not is_page_available(driver, logger, record):
                 logger.warning(f"Страница {url} не найдена (404).")
-                return None
+                return finish(None, "404")
 
             # Название (h1)
-            try:
-                h1 = driver.find_element(By.XPATH, "//h1")
-                data["Название"] = h1.text.strip()
+            if record is not None:
+                data["Название"] = record["title"] or "Не указано"
                 logger.info(f"Извлечено название: {data['Название']}")
-            except NoSuchElementException:
-                data["Название"] = "Не указано"
-                logger.warning("Не найден заголовок h1.")
+            else:
+                try:
+                    h1 = driver.find_element(By.XPATH, "//h1")
+                    data["Название"] = h1.text.strip()
+                    logger.info(f"Извлечено название: {data['Название']}")
+                except NoSuchElementException:
+                    data["Название"] = "Не указано"
+                    logger.warning("Не найден заголовок h1.")
 
             # Характеристики
-            chars = extract_characteristics(driver, logger)
+            with timer.stage("characteristics"):
+                if memo is not None:
+                    chars = memo.get(url, logger, lambda: extract_characteristics(driver, logger, record))
+                else:
+                    chars = extract_characteristics(driver, logger, record)
             if chars:
                 data.update(chars)
 
-            # Цены (включая 4 м)
-            prices = extract_prices(driver, logger)
+            # Цены (включая 4 м) — один снимок таблицы вместо запроса на каждую ячейку
+            with timer.stage("prices"):
+                prices = extract_prices_snapshot(driver, logger, record)
             data["Цены"] = prices
 
-            return data
+            return finish(data, "ok")
         except WebDriverException as e:
-            logger.error(f"WebDriverException: {e}, попытка #{attempt+1}. Перезапуск.")
+            if browser is not None:
+                logger.error(f"WebDriverException: {e}, попытка #{attempt+1}. Перезапуск.")
+                browser.restart()
+            else:
+                # Чужой драйвер не закрываем: вызывающий продолжит работать с ним же
+                logger.error(f"WebDriverException: {e}, попытка #{attempt+1}.")
             attempt += 1
-            driver.quit()
-            driver = setup_driver()
-            time.sleep(3)
         except Exception as e:
             logger.error(f"Ошибка при извлечении {url}: {e}, попытка #{attempt+1}.")
             attempt += 1
-            time.sleep(3)
 
-    logger.error(f"Не удалось извлечь данные для {url} после {retries} попыток.")
-    return None
+    logger.error(f"Не удалось извлечь данные для {url} (попыток: {retries}).")
+    return finish(None, "failed")
+
+####################################
+# 8. HTTP-РЕЖИМ (БЕЗ БРАУЗЕРА)      #
+####################################
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)",
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+
+def setup_session(pool_size=10):
+    """Создаёт requests.Session с пулом keep-alive соединений к поддоменам сайта."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HTTP_HEADERS)
+    return session
+
+def response_text(resp):
+    """
+    Тело ответа строкой. Если charset в Content-Type не указан, requests
+    по умолчанию декодирует text/html как ISO-8859-1 — сайт же отдаёт UTF-8.
+    """
+    if "charset" not in resp.headers.get("Content-Type", "").lower():
+        resp.encoding = "utf-8"
+    return resp.text
+
+def limited_request(session, method, url, limiter=None, **kwargs):
+    """
+    session.request с лимитером поддомена (HostRateLimiter): ждём свой токен,
+    а задержку, статус и Retry-After ответа отдаём лимитеру.
+    """
+    if limiter is None:
+        return session.request(method, url, **kwargs)
+    limiter.wait(url)
+    started = time.monotonic()
+    try:
+        resp = session.request(method, url, **kwargs)
+    except requests.RequestException:
+        limiter.observe(url, time.monotonic() - started, error=True)
+        raise
+    limiter.observe(url, time.monotonic() - started, resp.status_code,
+                    retry_after=resp.headers.get("Retry-After"))
+    return resp
+
+def limited_get(session, url, limiter=None, **kwargs):
+    return limited_request(session, "GET", url, limiter, **kwargs)
+
+def fetch_html(session, url, logger, timeout=15, limiter=None):
+    """
+    Загружает страницу обычным GET-запросом.
+    Возвращает (status_code, html); при сетевой ошибке — (None, None).
+    """
+    try:
+        resp = limited_get(session, url, limiter, timeout=timeout)
+        logger.info(f"HTTP {resp.status_code} для {url}")
+        return resp.status_code, response_text(resp)
+    except requests.RequestException as e:
+        logger.error(f"Ошибка HTTP-запроса {url}: {e}")
+        return None, None
+
+def fetch_with_cache(session, url, logger, cache, timeout=15, limiter=None):
+    """
+    Условный GET (If-None-Match / If-Modified-Since).
+    Возвращает (status_code, html, changed):
+      304 или то же тело  -> (200, html из кэша / ответа, False),
+      новое тело          -> (200, html, True),
+      прочие ответы       -> (status, html, True); сетевая ошибка -> (None, None, True).
+    """
+    headers = cache.conditional_headers(url)
+    try:
+        resp = limited_get(session, url, limiter, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        logger.error(f"Ошибка HTTP-запроса {url}: {e}")
+        return None, None, True
+    logger.info(f"HTTP {resp.status_code} для {url}")
+
+    if resp.status_code == 304:
+        body = cache.read_body(url)
+        if body is not None:
+            cache.mark_fresh(url)
+            logger.info("Страница не изменилась (304), берём тело из кэша.")
+            return 200, body, False
+        # Тело пропало из кэша — запрашиваем заново без условий
+        resp = limited_get(session, url, limiter, timeout=timeout)
+
+    html = response_text(resp)
+    if resp.status_code == 200:
+        changed = cache.store(
+            url, html, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        )
+        if not changed:
+            logger.info("Тело страницы не изменилось (тот же хэш).")
+        return 200, html, changed
+
+    return resp.status_code, html, True
+
+def cell_text(tag):
+    """Текст элемента с нормализованными пробелами (как .text у Selenium)."""
+    return " ".join(tag.get_text(" ").split())
+
+def is_html_page_available(soup, logger):
+    """То же, что is_page_available, но по уже загруженному HTML."""
+    title = soup.title.get_text() if soup.title else ""
+    if "404" in title.lower():
+        logger.warning("Страница вернула 404 (title).")
+        return False
+    for h1 in soup.find_all("h1"):
+        if "404" in h1.get_text():
+            logger.warning("Заголовок h1 '404' найден на странице.")
+            return False
+    return True
+
+def has_required_elements(soup):
+    """В HTML есть h1 и хотя бы блок характеристик или таблица цен."""
+    if soup.find("h1") is None:
+        return False
+    return soup.select_one("div.prod_desc, div.description, table.tb2.adaptive.poly-price") is not None
+
+def extract_characteristics_html(soup, logger):
+    """Аналог extract_characteristics для HTML, полученного без браузера."""
+    characteristics = {}
+    desc_div = soup.select_one("div.prod_desc") or soup.select_one("div.description")
+    if desc_div is None:
+        logger.warning("Не найден блок характеристик (div.prod_desc / div.description).")
+    else:
+        try:
+            characteristics = parse_characteristics_html(desc_div.decode_contents(), logger)
+        except Exception as e:
+            logger.error(f"Ошибка при извлечении характеристик: {e}")
+
+    logger.info(f"Итоговые характеристики: {characteristics}")
+    return characteristics
+
+def extract_prices_html(soup, logger):
+    """Аналог extract_prices: те же ключи '<тип> (<data-label>)', но по HTML."""
+    table = soup.select_one("table.tb2.adaptive.poly-price")
+    if table is None:
+        logger.warning("Таблица .tb2.adaptive.poly-price не найдена (цены не извлечены).")
+        return {}
+
+    rows = [
+        [(cell_text(td), td.get("data-label") or "") for td in tr.find_all("td")]
+        for tr in table.find_all("tr")
+    ]
+    return prices_from_rows(rows, logger)
+
+def extract_teplitsa_data_from_html(soup, logger, url=None, memo=None):
+    """
+    Собирает запись о теплице из готового HTML (название, характеристики, цены).
+    memo — CharacteristicsMemo: характеристики страницы url берутся из памяти, если товар уже разобран.
+    """
+    data = {}
+    h1 = soup.find("h1")
+    if h1 is not None:
+        # На сайте h1 выводится с text-transform: uppercase, и Selenium
+        # отдаёт его уже заглавными — приводим к тому же виду.
+        data["Название"] = cell_text(h1).upper()
+        logger.info(f"Извлечено название: {data['Название']}")
+    else:
+        data["Название"] = "Не указано"
+        logger.warning("Не найден заголовок h1.")
+
+    if memo is not None:
+        chars = memo.get(url, logger, lambda: extract_characteristics_html(soup, logger))
+    else:
+        chars = extract_characteristics_html(soup, logger)
+    if chars:
+        data.update(chars)
+
+    data["Цены"] = extract_prices_html(soup, logger)
+    return data
+
+def extract_teplitsa_data_http(session, url, logger, get_driver=None, cache=None, metrics=None, city=None,
+                               limiter=None, memo=None):
+    """
+    Загружает страницу через HTTP и парсит её без браузера.
+    Если нужных элементов в ответе нет (или запрос не удался),
+    уходит в обычный Selenium-путь extract_teplitsa_data.
+    get_driver — функция, лениво возвращающая драйвер (или None — без fallback).
+    cache — PageCache: условный запрос, и если страница не изменилась,
+    возвращается запись, разобранная в прошлый раз.
+    metrics — RunMetrics: время загрузки и разбора (и браузерных этапов при fallback).
+    city — CityPreset для браузерного fallback.
+    limiter — HostRateLimiter для HTTP-запроса и браузерного fallback.
+    memo — CharacteristicsMemo: характеристики товара один раз на все города.
+    """
+    timer = PageTimer()
+
+    def finish(result, status):
+        if metrics is not None:
+            metrics.observe(url, logger.name, timer, status=status)
+        return result
+
+    logger.info(f"\nЗагружаем по HTTP: {url}")
+    with timer.stage("http_fetch"):
+        if cache is not None:
+            status, html, changed = fetch_with_cache(session, url, logger, cache, limiter=limiter)
+        else:
+            status, html = fetch_html(session, url, logger, limiter=limiter)
+            changed = True
+    if cache is not None and status == 200 and not changed:
+        parsed = cache.cached_parsed(url)
+        if parsed is not None:
+            logger.info("Страница не изменилась, разбор пропущен (запись из кэша).")
+            return finish(parsed, "ok")
+    if status == 404:
+        logger.warning(f"Страница {url} не найдена (404).")
+        return finish(None, "404")
+
+    if status == 200 and html:
+        with timer.stage("html_parse"):
+            soup = BeautifulSoup(html, "html.parser")
+            available = is_html_page_available(soup, logger)
+            complete = available and has_required_elements(soup)
+            data = extract_teplitsa_data_from_html(soup, logger, url, memo) if complete else None
+        if not available:
+            logger.warning(f"Страница {url} не найдена (404).")
+            return finish(None, "404")
+        if complete:
+            if cache is not None:
+                cache.save_parsed(url, data)
+            return finish(data, "ok")
+        logger.info("В HTML нет нужных элементов, переходим на браузер.")
+
+    if get_driver is None:
+        logger.error(f"Не удалось извлечь данные для {url} по HTTP, браузер отключён.")
+        return finish(None, "failed")
+    return extract_teplitsa_data(get_driver(), url, logger, metrics=metrics, timer=timer, city=city,
+                                 limiter=limiter, memo=memo)
 
 ############################
-# 8. ОСНОВНАЯ ФУНКЦИЯ main #
+# 9. ОСНОВНАЯ ФУНКЦИЯ main #
 ############################
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Парсер теплиц teplitsa-rus.ru по всем городам.")
+    parser.add_argument(
+        "--fetch",
+        choices=["browser", "http", "async", "catalog"],
+        default="browser",
+        help="browser — каждая страница через Chrome; http — сначала обычный HTTP, Chrome только как запасной вариант; "
+             "async — то же, что http, но много запросов одновременно; "
+             "catalog — быстрое обновление цен по одной странице каталога на город "
+             "(свои файлы teplicy_catalog_*, без таблицы и истории цен)",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=32,
+                        help="async: общий лимит одновременных запросов")
+    parser.add_argument("--per-host", type=int, default=4,
+                        help="async и проверка URL перед обходом: лимит одновременных запросов к одному поддомену")
+    parser.add_argument("--cache-dir", default=None,
+                        help="http/async: папка кэша страниц (условные запросы, разбор только изменившихся)")
+    parser.add_argument("--cache-max-mb", type=int, default=500,
+                        help="лимит размера кэша страниц, МБ (вытеснение LRU)")
+    parser.add_argument("--cache-ttl-days", type=float, default=7,
+                        help="сколько дней хранить страницу в кэше")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="browser: сколько Chrome-воркеров обходят ссылки параллельно")
+    parser.add_argument("--pool-mode", choices=["thread", "process"], default="thread",
+                        help="browser: воркеры-потоки или воркеры-процессы")
+    parser.add_argument("--discover", action="store_true",
+                        help="перед обходом найти новые товары и города (каталог + sitemap) и дописать "
+                             "недостающие строки в teplicy_links_final.csv (python discovery.py)")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="обойти только шард i из N (0..N-1), например 0/4; результаты шардов "
+                             "объединяет python sharding.py")
+    parser.add_argument("--shard-by", choices=["city", "product"], default="city",
+                        help="как делить ссылки: по городам (по умолчанию) или по хэшу теплицы")
+    parser.add_argument("--journal", default=None,
+                        help="журнал прогресса (JSONL), по умолчанию <папка вывода>/teplicy[_shardIofN]_progress.jsonl")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный прогон: пропустить пары из журнала")
+    parser.add_argument("--metrics", default=None,
+                        help="префикс файлов сводки прогона (<префикс>.json и <префикс>.prom), "
+                             "по умолчанию <папка вывода>/teplicy_metrics")
+    parser.add_argument("--wait", choices=["popup", "targeted"], default="popup",
+                        help="browser: popup — ждать окно выбора города на каждой странице (до 5 с); "
+                             "targeted — выставить город заранее (через /robots.txt поддомена, один запрос "
+                             "на поддомен за сессию браузера) и ждать только h1 / таблицу цен; "
+                             "без --city-cookie первая страница каждого поддомена в каждой сессии браузера "
+                             "идёт запасным путём (ожидание до --content-timeout и клик по окну города), "
+                             "дальше ставятся cookie, запомненные после клика")
+    parser.add_argument("--city-cookie", action="append", default=[], metavar="ИМЯ=ЗНАЧЕНИЕ",
+                        help="targeted: cookie выбора города (можно несколько раз)")
+    parser.add_argument("--city-storage", action="append", default=[], metavar="КЛЮЧ=ЗНАЧЕНИЕ",
+                        help="targeted: запись localStorage выбора города (можно несколько раз)")
+    parser.add_argument("--content-timeout", type=float, default=4,
+                        help="targeted: сколько секунд ждать h1 / таблицу цен до проверки окна города")
+    parser.add_argument("--browser-profile", choices=["full", "lean"], default="full",
+                        help="full — Chrome грузит всё; lean — eager-загрузка, без картинок, шрифтов, видео "
+                             "и сторонних скриптов")
+    parser.add_argument("--block-url", action="append", default=[], metavar="ШАБЛОН",
+                        help="lean: ещё один шаблон URL для блокировки, например '*.css' (можно несколько раз)")
+    parser.add_argument("--recycle-pages", type=int, default=200,
+                        help="перезапускать Chrome после стольких страниц (0 — не перезапускать)")
+    parser.add_argument("--recycle-rss-mb", type=int, default=1500,
+                        help="перезапускать Chrome, когда его память (RSS со всеми процессами) больше, МБ (0 — не следить)")
+    parser.add_argument("--fsync-interval", type=float, default=5,
+                        help="как часто синхронизировать журнал с диском, секунды (0 — после каждой страницы)")
+    parser.add_argument("--throttle", choices=["adaptive", "fixed"], default="adaptive",
+                        help="adaptive — лимит запросов на поддомен, подстраивается под задержки, 429 / 5xx "
+                             "и Retry-After; fixed — прежняя пауза 1–2 с после каждой страницы")
+    parser.add_argument("--host-rate", type=float, default=1.0,
+                        help="adaptive: начальная скорость, запросов в секунду на поддомен")
+    parser.add_argument("--host-max-rate", type=float, default=4.0,
+                        help="adaptive: потолок скорости, запросов в секунду на поддомен")
+    parser.add_argument("--dedupe", choices=["off", "redirect", "canonical"], default="redirect",
+                        help="перед обходом проверить URL дешёвыми запросами и обходить страницу один раз на "
+                             "все строки, что ведут в неё: redirect — по редиректам (HEAD), canonical — ещё и по "
+                             "<link rel=canonical>; off — не проверять. Это ещё по запросу на каждый URL "
+                             "(вместе с предварительной проверкой — один на оба), через тот же лимитер "
+                             "поддоменов, что и обход. В режиме catalog не используется")
+    parser.add_argument("--resolve-workers", type=int, default=16,
+                        help="сколько URL проверять одновременно перед обходом (всего; на поддомен — до --per-host)")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="не проверять URL перед обходом (HEAD/GET через лимитер поддоменов) и не пропускать известные 404")
+    parser.add_argument("--dead-cache", default=None,
+                        help="негативный кэш 404 (JSON), по умолчанию <папка вывода>/teplicy[_shardIofN]_dead_urls.json")
+    parser.add_argument("--dead-ttl-days", type=float, default=7,
+                        help="сколько дней не запрашивать URL, ответивший 404")
+    parser.add_argument("--no-memo", action="store_true",
+                        help="разбирать характеристики на каждой странице, а не один раз на товар")
+    parser.add_argument("--memo-sample", type=float, default=0.05,
+                        help="доля страниц, на которых характеристики всё равно разбираются и сверяются с памятью")
+    parser.add_argument("--retry-rounds", type=int, default=3,
+                        help="сколько раундов повторов неудачных ссылок после основного прохода")
+    parser.add_argument("--retry-delay", type=float, default=10,
+                        help="пауза перед первым раундом повторов, секунды (дальше — вдвое больше)")
+    parser.add_argument("--dead-letter", default=None,
+                        help="файл ссылок, не извлечённых и после повторов (NDJSON), "
+                             "по умолчанию <папка вывода>/teplicy[_shardIofN]_dead_letter.jsonl")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="обойти только ссылки из dead-letter файла; удачные дописываются в журнал")
+    parser.add_argument("--price-dataset", default=None,
+                        help="папка нормализованной таблицы цен (разделы run_date=ГГГГ-ММ-ДД); без флага не пишется")
+    parser.add_argument("--price-format", choices=["parquet", "arrow"], default="parquet",
+                        help="формат таблицы цен")
+    parser.add_argument("--history", default=None,
+                        help="файл истории цен SQLite, по умолчанию <папка вывода>/teplicy_price_history.sqlite")
+    parser.add_argument("--no-history", action="store_true", help="не записывать цены прогона в историю")
+    return parser.parse_args(argv)
+
+def parse_pairs(pairs):
+    """['имя=значение', ...] -> {имя: значение}."""
+    result = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Ожидается ИМЯ=ЗНАЧЕНИЕ, получено: {pair}")
+        result[name.strip()] = value.strip()
+    return result
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # CSV со всеми теплицами и городами
     csv_file = "teplicy_links_final.csv"  
 
@@ -303,46 +1020,242 @@ def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     logging.info("Запуск скрипта парсинга...")
 
-    driver = setup_driver(chromedriver_path)
-    logging.info("WebDriver успешно запущен.")
+    # Профиль Chrome для всех драйверов прогона (--browser-profile, --block-url)
+    browser = {"lean": args.browser_profile == "lean", "blocked_urls": args.block_url}
+
+    # В HTTP-режиме браузер запускается только при первом fallback
+    driver = None
+
+    # Chrome перезапускается каждые --recycle-pages страниц или при RSS выше --recycle-rss-mb
+    recycle = {"max_pages": args.recycle_pages, "max_rss_mb": args.recycle_rss_mb}
+
+    def get_driver():
+        nonlocal driver
+        if driver is None:
+            driver = ManagedDriver(lambda: setup_driver(chromedriver_path, **browser), **recycle)
+            driver.driver  # запускаем Chrome сразу, а не на первой странице
+            logging.info("WebDriver успешно запущен.")
+        return driver
+
+    cache = None
+    if args.cache_dir and args.fetch in ("http", "async", "catalog"):
+        cache = PageCache(args.cache_dir, args.cache_max_mb * 1024 * 1024, args.cache_ttl_days * 24 * 3600)
+        logging.info(f"Кэш страниц: {args.cache_dir}")
+
+    session = None
+    if args.fetch == "async":
+        logging.info("Async-режим, Chrome — только запасной вариант.")
+    elif args.fetch in ("http", "catalog"):
+        session = setup_session()
+        logging.info("HTTP-сессия создана, Chrome — только запасной вариант.")
+    elif args.workers <= 1:
+        get_driver()
 
     logger = logging.getLogger("GLOBAL")
 
-    # 1. Читаем CSV
+    # Скорость запросов к каждому поддомену (вместо фиксированной паузы после страницы)
+    limiter = None
+    if args.throttle == "adaptive":
+        limiter = HostRateLimiter(args.host_rate, max_rate=args.host_max_rate)
+
+    # Характеристики товара одинаковы во всех городах — разбираются один раз на товар
+    memo = None if args.no_memo else CharacteristicsMemo(args.memo_sample)
+
+    # 1. Читаем CSV (с --discover — сначала дописываем в него новые товары и города)
+    if args.discover:
+        from discovery import update_matrix
+        update_matrix(matrix_csv=csv_file)
     all_links = read_links_from_csv(csv_file, logger)
-    all_data = []
+    # Шард (--shard i/N): только своя часть ссылок, файлы вывода с суффиксом шарда
+    suffix = shard_suffix(args.shard)
+    if args.shard:
+        all_links = select_shard(all_links, args.shard, args.shard_by)
+
+    # У режима catalog свои файлы: его записи («Цена от» из карточки) по схеме другие,
+    # и полный прогон не должен их перезаписывать или смешиваться с ними
+    run_name = f"teplicy_catalog{suffix}" if args.fetch == "catalog" else f"teplicy{suffix}"
+
+    # Журнал прогресса: каждая готовая пара (теплица, город) сразу пишется на диск
+    journal_path = args.journal or os.path.join(output_folder, f"{run_name}_progress.jsonl")
+    dead_letter_path = args.dead_letter or os.path.join(output_folder, f"{run_name}_dead_letter.jsonl")
+    # Записи сразу уходят в журнал (NDJSON) и в памяти не копятся; итоговый JSON строится из него.
+    # --retry-failed дописывает в журнал прошлого прогона только ссылки из dead-letter файла
+    journal = ProgressJournal(journal_path, resume=args.resume or args.retry_failed,
+                              fsync_interval=args.fsync_interval, keep_data=False)
+    if args.retry_failed:
+        pending_links = read_dead_letter(dead_letter_path)
+        logging.info(f"--retry-failed: {len(pending_links)} ссылок из '{dead_letter_path}'.")
+    else:
+        pending_links = journal.pending(all_links)
+    # Время этапов по каждой ссылке: куда уходят часы прогона
+    metrics = RunMetrics()
+    city = None
+    if args.wait == "targeted":
+        city = CityPreset(parse_pairs(args.city_cookie), parse_pairs(args.city_storage), args.content_timeout)
+    if args.resume and not args.retry_failed:
+        logging.info(
+            f"--resume: уже готово {len(all_links) - len(pending_links)}, осталось {len(pending_links)}."
+        )
 
-    # 2. Для каждой строки (теплица + город + URL)
-    for link_info in all_links:
-        city_name = link_info["Город"]  # Например, "Москва"
-        logger_city = setup_logging(city_name)
+    # 2. Обход ссылок (теплица + город + URL) в выбранном режиме
+    def crawl(links, on_result):
+        if args.fetch == "async":
+            from async_crawler import run_async_crawl
+            run_async_crawl(links, get_driver, args.max_concurrency, args.per_host, cache=cache,
+                            on_result=on_result, metrics=metrics, city=city, limiter=limiter, memo=memo)
+        elif args.fetch == "catalog":
+            from catalog_listing import run_catalog_crawl
 
-        logger_city.info(f"\nНачинаем обработку: {link_info['Название']} (город: {city_name})")
+            def full_page(link_info):
+                # Карточки нет или она неоднозначна — разбираем страницу товара
+                logger_city = setup_logging(link_info["Город"])
+                tepl_data = extract_teplitsa_data_http(session, link_info["URL"], logger_city, get_driver,
+                                                       cache, metrics, city, limiter, memo)
+                if tepl_data:
+                    tepl_data["Город"] = link_info["Город"]
+                return tepl_data
 
-        # 3. Извлекаем данные о теплице
-        tepl_data = extract_teplitsa_data(driver, link_info["URL"], logger_city)
-        if tepl_data:
-            tepl_data["Город"] = city_name
-            all_data.append(tepl_data)
-            logger_city.info(f"Данные для {link_info['Название']} ({city_name}) извлечены.")
+            run_catalog_crawl(links, session, full_page, on_result=on_result, limiter=limiter)
+        elif args.fetch == "browser" and args.workers > 1:
+            from driver_pool import run_driver_pool
+            run_driver_pool(links, args.workers, args.pool_mode, chromedriver_path,
+                            on_result=on_result, metrics=metrics, city=city, browser=browser,
+                            recycle=recycle, limiter=limiter, memo=memo)
         else:
-            logger_city.warning(f"Не удалось извлечь данные для {link_info['Название']} ({city_name}).")
+            for link_info in links:
+                city_name = link_info["Город"]  # Например, "Москва"
+                logger_city = setup_logging(city_name)
+
+                logger_city.info(f"\nНачинаем обработку: {link_info['Название']} (город: {city_name})")
+
+                # 3. Извлекаем данные о теплице
+                if session is not None:
+                    tepl_data = extract_teplitsa_data_http(session, link_info["URL"], logger_city, get_driver,
+                                                           cache, metrics, city, limiter, memo)
+                else:
+                    tepl_data = extract_teplitsa_data(driver, link_info["URL"], logger_city, metrics=metrics,
+                                                      city=city, limiter=limiter, memo=memo)
+                if tepl_data:
+                    tepl_data["Город"] = city_name
+                    logger_city.info(f"Данные для {link_info['Название']} ({city_name}) извлечены.")
+                else:
+                    logger_city.warning(
+                        f"Не удалось извлечь данные для {link_info['Название']} ({city_name})."
+                    )
+                on_result(link_info, tepl_data)
+
+                # 4. Без лимитера (--throttle fixed) — задержка от 1 до 2 сек
+                if limiter is None:
+                    time.sleep(random.uniform(1, 2))
+
+    # Предварительная проверка: лёгкие HEAD/GET по всем URL, 404 — в негативный кэш
+    # и мимо Chrome; известные 404 не запрашиваются до истечения TTL
+    checked = None
+    dead_cache = None
+    if not args.no_preflight and args.fetch != "catalog" and pending_links:
+        from preflight import NegativeCache, run_preflight
+        dead_cache_path = args.dead_cache or os.path.join(output_folder, f"teplicy{suffix}_dead_urls.json")
+        dead_cache = NegativeCache(dead_cache_path, args.dead_ttl_days * 24 * 3600)
+        pending_links, skipped, checked = run_preflight(pending_links, dead_cache, args.resolve_workers,
+                                                        canonical=args.dedupe == "canonical", limiter=limiter,
+                                                        per_host=args.per_host)
+        for link_info in skipped:
+            journal.record(link_info, None)
+
+    # Строки, что ведут на одну и ту же страницу (редирект / canonical), обходятся один раз:
+    # результат представителя группы раздаётся всем её парам (теплица, город)
+    record = journal.record
+    groups = None
+    if args.dedupe != "off" and args.fetch != "catalog" and pending_links:
+        from url_resolver import resolve_links
+        groups = resolve_links(pending_links, args.resolve_workers, canonical=args.dedupe == "canonical",
+                               checked=checked, limiter=limiter, per_host=args.per_host)
+        pending_links = groups.representatives()
+        record = groups.fan_out(journal.record)
 
-        # 4. Задержка от 1 до 2 сек
-        time.sleep(random.uniform(1, 2))
+    # Неудачные ссылки не повторяются на месте, а откладываются до конца основного прохода;
+    # что не удалось и после раундов повторов — в dead-letter файл (обход: --retry-failed)
+    retry_queue = RetryQueue(args.retry_rounds, args.retry_delay)
 
-    # 5. Закрываем драйвер
-    driver.quit()
-    logging.info("WebDriver закрыт.")
+    def is_failed(link_info):
+        return metrics.status(link_info["URL"]) == "failed"
 
-    # 6. Сохранение итогового JSON в папку /Users/pavelkulcinskij/Desktop/city2
-    output_file = os.path.join(output_folder, "teplicy_all_cities_data.json")
+    crawl(pending_links, retry_queue.wrap(record, is_failed))
+    dead = retry_queue.run(crawl, record, is_failed)
+    for link_info in dead:
+        record(link_info, None)
+    if groups is not None:
+        dead = groups.expand(dead)
+    if dead_cache is not None:
+        from preflight import remember_soft_404, soft_404_candidates
+        # «Мягкий» 404 — только страницы с HTTP 200 на проверке и 404 по title / h1 при разборе
+        urls = [link_info["URL"] for link_info in pending_links]
+        remember_soft_404(dead_cache,
+                          soft_404_candidates([url for url in urls if metrics.status(url) == "404"], checked),
+                          parsed=[url for url in urls if metrics.status(url) == "ok"])
+    write_dead_letter(dead_letter_path, dead, retry_queue.attempts,
+                      append=args.resume and not args.retry_failed)
+
+    if limiter is not None:
+        limiter.log_summary()
+    if memo is not None:
+        memo.log_summary()
+
+    # 5. Закрываем драйвер и HTTP-сессию
+    if driver is not None:
+        logging.info(f"WebDriver: перезапусков за прогон: {driver.recycles}")
+        driver.quit()
+        logging.info("WebDriver закрыт.")
+    if session is not None:
+        session.close()
+    if cache is not None:
+        removed = cache.evict()
+        logging.info(f"Кэш страниц: вытеснено записей: {removed}")
+        cache.close()
+
+    # Сводка прогона: гистограммы этапов, города и поддомены (JSON + Prometheus)
+    metrics_prefix = args.metrics or os.path.join(output_folder, f"{run_name}_metrics")
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
-        logging.info(f"Все данные сохранены в '{output_file}'")
+        metrics.write(f"{metrics_prefix}.json", f"{metrics_prefix}.prom")
+        logging.info(f"Сводка прогона сохранена в '{metrics_prefix}.json' и '{metrics_prefix}.prom'")
+    except OSError as e:
+        logging.error(f"Ошибка при сохранении сводки прогона: {e}")
+
+    journal.close()
+
+    # 6. Сохранение итогового JSON в папку /Users/pavelkulcinskij/Desktop/city2:
+    # записи из прошлого (--resume) и текущего прогона в порядке CSV, построчно из журнала
+    if args.fetch == "catalog":
+        output_file = os.path.join(output_folder, f"teplicy_catalog_prices{suffix}.json")
+    else:
+        output_file = os.path.join(output_folder, f"teplicy_all_cities_data{suffix}.json")
+    try:
+        count = journal_to_json(journal_path, output_file, all_links)
+        logging.info(f"Все данные ({count} записей) сохранены в '{output_file}'")
     except Exception as e:
         logging.error(f"Ошибка при сохранении JSON: {e}")
 
+    # Таблица цен и история строятся из «Цены» (поликарбонат × длина), а у карточек каталога их нет
+    if args.fetch == "catalog":
+        if args.price_dataset or not args.no_history:
+            logging.info("Режим catalog: таблица цен и история цен не обновляются.")
+        return
+
+    # 7. Нормализованная таблица цен для аналитики (Parquet / Arrow по дате прогона)
+    if args.price_dataset:
+        from price_dataset import export_prices, load_records
+        export_prices(load_records(journal_path, field="data"), args.price_dataset, fmt=args.price_format,
+                      csv_file=csv_file, shard=args.shard)
+
+    # 8. История цен (SQLite): один файл на все прогоны и шарды
+    if not args.no_history:
+        from price_dataset import load_records
+        from price_history import PriceHistory
+        history = PriceHistory(args.history or os.path.join(output_folder, "teplicy_price_history.sqlite"))
+        try:
+            history.record(load_records(journal_path, field="data"), csv_file=csv_file)
+        finally:
+            history.close()
+
 if __name__ == "__main__":
     main()
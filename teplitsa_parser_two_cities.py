@@ -1,4 +1,3 @@
-import json
 import time
 import random
 import logging
@@ -16,6 +15,7 @@ from selenium.common.exceptions import (
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
+from result_sink import NdjsonSink, ndjson_to_json
 
 ########################
 # 1. ЛОГИРОВАНИЕ ГОРОДА #
@@ -294,8 +294,10 @@ def main():
     # 1. Читаем CSV (только для Москвы и Ставрополя)
     filtered_links = read_links_from_csv(csv_file, logger)
 
-    # 2. Сюда будем складывать результаты
-    all_data = []
+    # 2. Результаты сразу пишем построчно (NDJSON), в памяти не копим
+    output_file = "teplicy_msk_stavropol_data.json"  # или любое название
+    stream_file = f"{output_file}l"
+    sink = NdjsonSink(stream_file)
 
     # 3. Проходим по каждой ссылке
     for link_info in filtered_links:
@@ -307,7 +309,7 @@ def main():
         data = extract_teplitsa_data(driver, link_info["URL"], logger_city)
         if data:
             data["Город"] = city_name
-            all_data.append(data)
+            sink.write(data)
             logger_city.info(f"Данные извлечены: {link_info['Название']} ({city_name})")
         else:
             logger_city.warning(f"Не удалось извлечь {link_info['Название']} ({city_name}).")
@@ -318,11 +320,10 @@ def main():
     driver.quit()
     logging.info("WebDriver закрыт.")
 
-    # 5. Сохраняем результаты в JSON локально
-    output_file = "teplicy_msk_stavropol_data.json"  # или любое название
+    # 5. Сохраняем результаты в JSON локально (из NDJSON, в прежнем формате)
+    sink.close()
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=4)
+        ndjson_to_json(stream_file, output_file)
         logging.info(f"Результаты сохранены в '{output_file}'")
     except Exception as e:
         logging.error(f"Ошибка при сохранении JSON: {e}")
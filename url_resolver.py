@@ -0,0 +1,156 @@
+import copy
+import logging
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import requests
+
+from checkpoint import journal_key
+from teplitsa_parser import limited_request, setup_session
+
+CANONICAL_RE = re.compile(
+    r"<link\b[^>]*\brel=[\"']?canonical[\"']?[^>]*>", re.IGNORECASE
+)
+HREF_RE = re.compile(r"\bhref=[\"']?([^\"'\s>]+)", re.IGNORECASE)
+# Сколько байт начала страницы читать в поисках <link rel=canonical> (он в <head>)
+HEAD_BYTES = 64 * 1024
+
+#########################################
+# 1. КУДА НА САМОМ ДЕЛЕ ВЕДЁТ ССЫЛКА       #
+#########################################
+def canonical_from_head(html):
+    """href из <link rel="canonical" ...> или None."""
+    tag = CANONICAL_RE.search(html)
+    if tag is None:
+        return None
+    href = HREF_RE.search(tag.group(0))
+    return href.group(1) if href else None
+
+def content_key(final_url, canonical=None):
+    """
+    URL содержимого: адрес после редиректов или canonical относительно него.
+    Город на сайте выбирается и запросом ?city=..., а canonical его обычно
+    отбрасывает — запрос final_url сохраняется, иначе города склеились бы.
+    """
+    if not canonical:
+        return final_url
+    target = urlsplit(urljoin(final_url, canonical))
+    query = target.query or urlsplit(final_url).query
+    return urlunsplit((target.scheme, target.netloc, target.path, query, ""))
+
+def resolve_url(session, url, timeout=10, canonical=False, limiter=None):
+    """
+    Дешёвый запрос: HEAD с редиректами (canonical=False) или GET только
+    начала страницы (canonical=True). Возвращает (HTTP-статус, URL содержимого);
+    при ошибке — (None, url): страница обойдётся как обычно.
+    limiter — HostRateLimiter обхода: проверка тоже ждёт токен поддомена,
+    а 429 / Retry-After замедляют и её, и сам обход.
+    """
+    try:
+        if not canonical:
+            resp = limited_request(session, "HEAD", url, limiter, allow_redirects=True, timeout=timeout)
+            if resp.status_code != 405:
+                return resp.status_code, resp.url
+        with limited_request(session, "GET", url, limiter, allow_redirects=True, timeout=timeout,
+                             stream=True) as resp:
+            if not canonical or resp.status_code != 200:
+                return resp.status_code, resp.url
+            head = b""
+            for chunk in resp.iter_content(16384):
+                head += chunk
+                if b"</head>" in head.lower() or len(head) >= HEAD_BYTES:
+                    break
+            html = head.decode(resp.encoding or "utf-8", errors="replace")
+            return resp.status_code, content_key(resp.url, canonical_from_head(html))
+    except requests.RequestException as e:
+        logging.warning(f"Не удалось проверить {url}: {e}")
+        return None, url
+
+def check_urls(urls, workers=16, canonical=False, timeout=10, limiter=None, per_host=4):
+    """
+    Все urls параллельно через resolve_url: {url: (статус, URL содержимого)}.
+    workers — всего одновременных запросов, per_host — не больше стольких на поддомен,
+    limiter — HostRateLimiter (скорость на поддомен).
+    """
+    urls = list(OrderedDict.fromkeys(urls))
+    hosts = defaultdict(lambda: threading.Semaphore(per_host))
+    for url in urls:
+        hosts[urlsplit(url).netloc]
+
+    def check(url):
+        with hosts[urlsplit(url).netloc]:
+            return resolve_url(session, url, timeout, canonical, limiter)
+
+    session = setup_session(pool_size=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check, urls))
+    finally:
+        session.close()
+    return dict(zip(urls, results))
+
+#########################################
+# 2. ГРУППЫ ССЫЛОК С ОДНИМ СОДЕРЖИМЫМ     #
+#########################################
+class LinkGroups:
+    """
+    Строки CSV, сгруппированные по URL содержимого: каждая уникальная
+    страница обходится один раз (первой строкой группы), а результат
+    раздаётся всем парам (теплица, город) группы.
+    """
+
+    def __init__(self, links, resolved):
+        groups = OrderedDict()
+        for link_info in links:
+            groups.setdefault(resolved.get(link_info["URL"], link_info["URL"]), []).append(link_info)
+        self.groups = list(groups.values())
+        self.members_of = {journal_key(group[0]): group for group in self.groups}
+
+    def representatives(self):
+        return [group[0] for group in self.groups]
+
+    def members(self, link_info):
+        """Все строки группы, которую представляет link_info (или сама строка)."""
+        return self.members_of.get(journal_key(link_info), [link_info])
+
+    def expand(self, links):
+        return [member for link_info in links for member in self.members(link_info)]
+
+    def fan_out(self, on_result):
+        """on_result для обхода представителей: результат копируется каждой строке группы со своим Городом."""
+        def handle(link_info, data):
+            for member in self.members(link_info):
+                member_data = copy.deepcopy(data) if data else data
+                if member_data:
+                    member_data["Город"] = member["Город"]
+                on_result(member, member_data)
+        return handle
+
+def resolve_links(links, workers=16, canonical=False, timeout=10, checked=None, limiter=None, per_host=4):
+    """
+    Проверяет все URL параллельно дешёвыми запросами и группирует строки
+    по URL содержимого. checked — уже готовый результат check_urls
+    (например, от предварительной проверки preflight), тогда запросов нет.
+    limiter, per_host — как в check_urls.
+    Возвращает LinkGroups.
+    """
+    if checked is None:
+        checked = check_urls((link_info["URL"] for link_info in links), workers, canonical, timeout,
+                             limiter, per_host)
+    resolved = {url: final for url, (_status, final) in checked.items()}
+    redirected = sum(1 for url, final in resolved.items() if final != url)
+    groups = LinkGroups(links, resolved)
+    logging.info(
+        f"Проверка URL: {len(links)} строк, ведут в другое место {redirected}, "
+        f"уникальных страниц {len(groups.groups)} (по {'canonical' if canonical else 'редиректам'})."
+    )
+    shared = [group for group in groups.groups if len(group) > 1]
+    for group in shared[:20]:
+        cities = ", ".join(link_info["Город"] for link_info in group)
+        logging.info(f"  Одна страница на {len(group)} строк: {group[0]['Название']} ({cities})")
+    if len(shared) > 20:
+        logging.info(f"  ... и ещё {len(shared) - 20} таких страниц.")
+    return groups